@@ -9,3 +9,6 @@ except Exception:
 class ApiConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "api"
+
+    def ready(self):
+        from . import db  # noqa: F401  (connects the per-connection tuning hook)
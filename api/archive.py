@@ -0,0 +1,74 @@
+# api/archive.py
+"""
+Move closed requests (and their offers) out of the hot Request/Offer tables.
+
+Accepting an offer only flips statuses, so without archival the feed, nearby
+and offer queries work over tables that are mostly closed and rejected rows.
+`manage.py archive_requests` copies requests closed more than N days ago into
+ArchivedRequest/ArchivedOffer and deletes the originals, one batch per
+transaction: each batch is all-or-nothing and short enough not to hold up
+the app's writers for long. Archived rows leave the closed set, so an
+interrupted run resumes where it stopped by simply running again.
+"""
+import time
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ArchivedOffer, ArchivedRequest, Offer, Request
+
+REQUEST_FIELDS = [
+    'id', 'patient_id', 'symptoms', 'latitude', 'longitude', 'status', 'dispatch',
+    'created_at', 'updated_at', 'version',
+]
+OFFER_FIELDS = [
+    'id', 'request_id', 'doctor_id', 'price', 'eta_minutes', 'message', 'status',
+    'created_at', 'updated_at', 'version',
+]
+
+
+def archivable(cutoff):
+    """Closed requests last changed before `cutoff`, oldest first (request_status_updated_idx)."""
+    return Request.objects.filter(status='closed', updated_at__lt=cutoff).order_by('updated_at', 'id')
+
+
+def archive_batch(cutoff, batch_size):
+    """Archive up to `batch_size` requests in one transaction. Returns (requests, offers) moved."""
+    with transaction.atomic():
+        requests = list(archivable(cutoff).values(*REQUEST_FIELDS)[:batch_size])
+        if not requests:
+            return 0, 0
+        ids = [row['id'] for row in requests]
+        offers = list(Offer.objects.filter(request_id__in=ids).values(*OFFER_FIELDS))
+
+        now = timezone.now()
+        ArchivedRequest.objects.bulk_create(ArchivedRequest(archived_at=now, **row) for row in requests)
+        ArchivedOffer.objects.bulk_create(ArchivedOffer(**row) for row in offers)
+        # Offers first, so deleting the requests has nothing left to cascade to.
+        Offer.objects.filter(request_id__in=ids).delete()
+        Request.objects.filter(id__in=ids).delete()
+    return len(requests), len(offers)
+
+
+def archive_requests(older_than_days, batch_size=500, max_batches=None, pause=0.0, log=None):
+    """
+    Archive every request closed more than `older_than_days` ago, batch by batch.
+    `pause` seconds between batches leave room for the app's own writes.
+    Returns (requests, offers) moved.
+    """
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    totals = [0, 0]
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        moved_requests, moved_offers = archive_batch(cutoff, batch_size)
+        if not moved_requests:
+            break
+        batches += 1
+        totals[0] += moved_requests
+        totals[1] += moved_offers
+        if log:
+            log(f"batch {batches}: {moved_requests} requests, {moved_offers} offers")
+        if pause:
+            time.sleep(pause)
+    return tuple(totals)
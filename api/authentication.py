@@ -1,30 +1,40 @@
 # api/authentication.py
-import os
+import copy
+import hashlib
 from rest_framework import authentication, exceptions
-from firebase_admin import auth as firebase_auth
 from django.conf import settings
-import firebase_admin
-from firebase_admin import credentials
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
 
 # --- THIS IS THE CRITICAL CHANGE ---
 # Instead of importing the old User model directly, we use get_user_model()
 # This function dynamically retrieves the correct user model you defined in settings.py
 from django.contrib.auth import get_user_model
 
+from doctor_project import routers
+
+from . import firebase
+from .cache import TTLCache
+from .metrics import timed
+
 # Get your active user model (which is subscriptions.CustomUser)
 User = get_user_model()
 
-# initialize firebase admin if not initialized
-if not firebase_admin._apps:
-    key_path = getattr(settings, "FIREBASE_CREDENTIAL_PATH", None)
-    if key_path and os.path.exists(key_path):
-        cred = credentials.Certificate(key_path)
-        firebase_admin.initialize_app(cred)
-    else:
-        # This will prevent the app from crashing if the key is missing,
-        # but authentication will fail.
-        print("WARNING: Firebase credential file not found. Firebase auth will not work.")
-        pass
+# Verified tokens are cached until their own 'exp' so the RSA signature check
+# (and the occasional public-cert fetch) only runs once per token, not per request.
+token_cache = TTLCache(maxsize=getattr(settings, "FIREBASE_TOKEN_CACHE_SIZE", 10000))
+
+# Firebase uid -> CustomUser, so an authenticated request normally costs no query.
+# Entries are dropped whenever the user is saved or deleted in this process; the TTL
+# bounds staleness for changes made by other processes.
+user_cache = TTLCache(
+    maxsize=getattr(settings, "USER_CACHE_SIZE", 10000),
+    ttl=getattr(settings, "USER_CACHE_TTL", 300),
+)
+
+# The Firebase Admin SDK is imported and initialized on the first token
+# verification, not here (see api/firebase.py).
 
 class FirebaseAuthentication(authentication.BaseAuthentication):
     """
@@ -44,36 +54,101 @@ class FirebaseAuthentication(authentication.BaseAuthentication):
             raise exceptions.AuthenticationFailed("Invalid Authorization header format. Expected 'Bearer <token>'.")
 
         id_token = parts[1]
+        return (authenticate_token(id_token), None)
+
+
+def authenticate_token(id_token):
+    """
+    Turn a Firebase ID token into a CustomUser, raising AuthenticationFailed if it
+    is not valid. Shared by FirebaseAuthentication and the event stream, which
+    can't use DRF's authentication classes.
+    """
+    # Initialize the firebase app on first use. If that fails, auth is impossible.
+    if not settings.FIREBASE_TOKEN_VERIFIER and not firebase.initialize():
+        raise exceptions.AuthenticationFailed("Firebase Admin SDK is not initialized. Check server configuration.")
+
+    decoded = verify_token(id_token)
+
+    uid = decoded.get("uid")
+    if not uid:
+        # This should not happen with a valid token, but we check just in case.
+        raise exceptions.AuthenticationFailed("Invalid token: uid missing from decoded token.")
+
+    # Map Firebase uid -> Django CustomUser (username = uid)
+    # This now correctly uses your CustomUser model.
+    try:
+        user = resolve_user(uid, decoded.get("email"))
+    except Exception as e:
+        # This would catch potential database errors.
+        raise exceptions.APIException(f"Error retrieving or creating user in the database: {e}")
+    # Users who just wrote read from the primary (see doctor_project/routers.py)
+    routers.identify(user.id)
+    return user
+
+
+def verify_token(id_token):
+    """
+    Verify a Firebase ID token, answering from the token cache when possible.
+    Only successfully verified tokens are cached; failures always re-verify.
+    """
+    # Never keep the raw token in memory longer than needed; key on its digest.
+    key = hashlib.sha256(id_token.encode("utf-8")).hexdigest()
+    decoded = token_cache.get(key)
+    if decoded is not None:
+        return decoded
+
+    try:
+        # Verify the token against the Firebase project.
+        with timed("auth"):
+            decoded = _verify_id_token(id_token)
+    except Exception as e:
+        # The token is invalid, expired, or doesn't match the project.
+        raise exceptions.AuthenticationFailed(f"Invalid Firebase ID token: {e}")
+
+    expires_at = decoded.get("exp")
+    if expires_at:
+        token_cache.set(key, decoded, expires_at=expires_at)
+    return decoded
+
+
+def _verify_id_token(id_token):
+    # settings.FIREBASE_TOKEN_VERIFIER swaps Firebase out for a stub (load tests only).
+    if settings.FIREBASE_TOKEN_VERIFIER:
+        return import_string(settings.FIREBASE_TOKEN_VERIFIER)(id_token)
+    return firebase.verify_id_token(id_token)
+
+
+def resolve_user(uid, email=None):
+    """
+    Return the CustomUser for a Firebase uid, creating it on first sight.
+    The database is only hit on a cache miss, and the email is only written
+    when the token carries one that differs from what we have stored.
+    """
+    user = user_cache.get(uid)
+    cached = user is not None
+    if not cached:
+        # A plain read first: get_or_create() counts as a write and would pin the
+        # request (and this user's next few requests) to the primary database.
+        user = User.objects.filter(username=uid).first()
+        if user is None:
+            user, created = User.objects.get_or_create(username=uid, defaults={"email": email or ""})
+
+    if email and user.email != email:
+        user = copy.copy(user)
+        user.email = email
+        user.save(update_fields=["email"])
+        cached = False
+
+    # Only (re)cache after a database read or write: refreshing the entry on every
+    # hit would let a polling client keep a stale user forever.
+    if not cached:
+        user_cache.set(uid, user)
+    # Hand out a copy so a view mutating request.user can't leak into the cache.
+    return copy.copy(user)
+
 
-        # Check if the firebase app was initialized. If not, auth is impossible.
-        if not firebase_admin._apps:
-            raise exceptions.AuthenticationFailed("Firebase Admin SDK is not initialized. Check server configuration.")
-
-        try:
-            # Verify the token against the Firebase project.
-            decoded = firebase_auth.verify_id_token(id_token)
-        except Exception as e:
-            # The token is invalid, expired, or doesn't match the project.
-            raise exceptions.AuthenticationFailed(f"Invalid Firebase ID token: {e}")
-
-        uid = decoded.get("uid")
-        if not uid:
-            # This should not happen with a valid token, but we check just in case.
-            raise exceptions.AuthenticationFailed("Invalid token: uid missing from decoded token.")
-
-        # Map Firebase uid -> Django CustomUser (username = uid)
-        # This now correctly uses your CustomUser model.
-        try:
-            user, created = User.objects.get_or_create(username=uid)
-
-            # Optional: If a new user was created, you can populate fields
-            # from the Firebase token, like their email.
-            if created:
-                if decoded.get('email'):
-                    user.email = decoded.get('email')
-                    user.save()
-
-            return (user, None)
-        except Exception as e:
-            # This would catch potential database errors.
-            raise exceptions.APIException(f"Error retrieving or creating user in the database: {e}")
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def _invalidate_user_cache(sender, instance, **kwargs):
+    # Note: queryset.update() bypasses signals, so bulk updates rely on the TTL.
+    user_cache.delete(instance.username)
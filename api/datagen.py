@@ -0,0 +1,192 @@
+# api/datagen.py
+"""
+Synthetic data at production scale, for `manage.py generate_data` and the
+bench_queries benchmark.
+
+Everything is written with bulk_create in batches, which skips Model.save():
+geohashes and change versions are therefore filled in here, and the
+auto_now/auto_now_add timestamps are switched off while generating so rows
+can carry realistic, spread-out creation times.
+"""
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+from subscriptions.models import Subscription
+
+from . import geo
+from .models import DoctorProfile, Offer, Request, next_version
+
+User = get_user_model()
+
+# (region, latitude, longitude, spread in degrees, share of the population)
+CITIES = [
+    ("Dar es Salaam", -6.8161, 39.2803, 0.12, 45),
+    ("Arusha", -3.3869, 36.6830, 0.06, 12),
+    ("Mwanza", -2.5164, 32.9175, 0.06, 12),
+    ("Dodoma", -6.1630, 35.7516, 0.05, 10),
+    ("Mbeya", -8.9094, 33.4608, 0.05, 8),
+    ("Zanzibar", -6.1659, 39.2026, 0.04, 8),
+    ("Moshi", -3.3348, 37.3404, 0.04, 5),
+]
+
+SYMPTOMS = [
+    "Fever and headache", "Persistent cough", "Stomach pain", "Child with high fever",
+    "Back pain", "Dizziness and nausea", "Rash on arms", "Chest tightness",
+]
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Let bulk_create keep the created_at/updated_at values we set instead of now()."""
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, "auto_now", False) or getattr(field, "auto_now_add", False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class DataGenerator:
+    def __init__(self, seed=0, batch_size=5000, history_days=90, log=None):
+        self.rng = random.Random(seed)
+        self.batch_size = batch_size
+        self.history = timedelta(days=history_days)
+        self.now = timezone.now()
+        # Keeps usernames unique when generating into a database more than once.
+        self.tag = f"{seed}-{time.time_ns() // 1000:x}"
+        self.log = log or (lambda message: None)
+        self.doctor_ids = []
+        self.patient_ids = []
+        self._user_counts = {}
+
+    def _batches(self, count):
+        for start in range(0, count, self.batch_size):
+            yield start, min(self.batch_size, count - start)
+
+    def _place(self):
+        region, lat, lng, spread, _ = self.rng.choices(CITIES, weights=[c[4] for c in CITIES])[0]
+        return region, round(self.rng.gauss(lat, spread), 6), round(self.rng.gauss(lng, spread), 6)
+
+    def _phone(self):
+        return f"+255{self.rng.choice('67')}{self.rng.randrange(10 ** 8):08}"
+
+    def _users(self, kind, count, **fields):
+        first = self._user_counts.get(kind, 0)
+        self._user_counts[kind] = first + count
+        users = User.objects.bulk_create(
+            (User(username=f"gen-{kind}-{self.tag}-{first + i}", password="!", **fields) for i in range(count)),
+            batch_size=self.batch_size,
+        )
+        return [user.pk for user in users]
+
+    def doctors(self, count):
+        """Doctors with profiles spread around Tanzania's cities, and an app token each."""
+        for _, size in self._batches(count):
+            ids = self._users("doctor", size, is_doctor=True, is_patient=False)
+            profiles = []
+            for i, user_id in enumerate(ids):
+                region, lat, lng = self._place()
+                profiles.append(DoctorProfile(
+                    user_id=user_id, full_name=f"Dr. Generated {len(self.doctor_ids) + i}", phone_number=self._phone(),
+                    region=region, latitude=lat, longitude=lng, geohash=geo.encode(lat, lng),
+                ))
+            DoctorProfile.objects.bulk_create(profiles, batch_size=self.batch_size)
+            Subscription.objects.bulk_create(
+                (Subscription(user_id=user_id, fcm_token=f"gen-fcm-{self.tag}-d{user_id}") for user_id in ids),
+                batch_size=self.batch_size,
+            )
+            self.doctor_ids.extend(ids)
+        self.log(f"{count} doctors")
+
+    def patients(self, count):
+        for _, size in self._batches(count):
+            self.patient_ids.extend(self._users("patient", size))
+        self.log(f"{count} patients")
+
+    def subscribers(self, count):
+        """AfyaPlus subscribers (USSD and app) across every subscription state."""
+        states = [
+            # (status, cover relative to now, payment failures, weight)
+            (Subscription.Status.ACTIVE, (1, 7 * 24), 0, 55),
+            (Subscription.Status.ACTIVE, (-72, 0), 0, 10),  # lapsed, awaiting expiry
+            (Subscription.Status.ACTIVE, (0, 24), 2, 5),    # in the grace period
+            (Subscription.Status.INACTIVE, (-24 * 60, -1), 0, 20),
+            (Subscription.Status.PAUSED, (-24 * 30, -1), 3, 10),
+        ]
+        weights = [state[3] for state in states]
+        with explicit_timestamps(Subscription):
+            for _, size in self._batches(count):
+                ids = self._users("subscriber", size)
+                rows = []
+                for user_id in ids:
+                    status, (low, high), failures, _ = self.rng.choices(states, weights)[0]
+                    valid_until = self.now + timedelta(hours=self.rng.uniform(low, high))
+                    rows.append(Subscription(
+                        user_id=user_id,
+                        # Roughly a third also use the app.
+                        fcm_token=f"gen-fcm-{self.tag}-s{user_id}" if self.rng.random() < 0.3 else None,
+                        phone_number=self._phone(),
+                        status=status,
+                        start_date=valid_until - timedelta(days=7),
+                        valid_until=valid_until,
+                        consecutive_payment_failures=failures,
+                        created_at=valid_until - timedelta(days=self.rng.randint(7, 180)),
+                    ))
+                Subscription.objects.bulk_create(rows, batch_size=self.batch_size)
+        self.log(f"{count} subscribers")
+
+    def requests(self, count, offers_per_request=3):
+        """
+        Patient requests over the last `history_days`, each with 0..2x
+        offers_per_request offers. Recent requests are mostly still open; older
+        ones are closed with one accepted offer and the rest rejected.
+        """
+        if not self.patient_ids or not self.doctor_ids:
+            raise ValueError("Generate patients and doctors before requests.")
+        history = self.history.total_seconds()
+        with explicit_timestamps(Request, Offer):
+            for start, size in self._batches(count):
+                batch = []
+                for _ in range(size):
+                    _, lat, lng = self._place()
+                    created = self.now - timedelta(seconds=history * self.rng.random() ** 2)
+                    is_open = self.rng.random() < (0.8 if self.now - created < timedelta(days=1) else 0.02)
+                    batch.append(Request(
+                        patient_id=self.rng.choice(self.patient_ids),
+                        symptoms=self.rng.choice(SYMPTOMS),
+                        latitude=lat, longitude=lng, geohash=geo.encode(lat, lng),
+                        status="open" if is_open else "closed",
+                        created_at=created,
+                        updated_at=created if is_open else created + timedelta(minutes=self.rng.randint(5, 120)),
+                        version=next_version(),
+                    ))
+                batch = Request.objects.bulk_create(batch, batch_size=self.batch_size)
+
+                offers = []
+                for request in batch:
+                    n = min(self.rng.randint(0, 2 * offers_per_request), len(self.doctor_ids))
+                    for i, doctor_id in enumerate(self.rng.sample(self.doctor_ids, n)):
+                        if request.status == "open":
+                            status = "pending"
+                        else:
+                            status = "accepted" if i == 0 else "rejected"
+                        offers.append(Offer(
+                            request_id=request.pk, doctor_id=doctor_id,
+                            price=self.rng.randrange(5000, 50000, 500), eta_minutes=self.rng.randint(5, 90),
+                            message="", status=status,
+                            created_at=request.created_at + timedelta(minutes=self.rng.randint(1, 30)),
+                            updated_at=request.updated_at, version=next_version(),
+                        ))
+                Offer.objects.bulk_create(offers, batch_size=self.batch_size)
+                self.log(f"{start + size}/{count} requests")
@@ -0,0 +1,37 @@
+# api/db.py
+"""
+Per-connection database tuning (see DATABASES and SQLITE_PRAGMAS in settings.py).
+
+SQLite's defaults (rollback journal, synchronous=FULL, no busy timeout) make
+every writer block every reader and fail fast with "database is locked" under
+concurrent OfferCreateView posts. SQLITE_PRAGMAS are applied to each new
+connection, primary and replicas alike:
+
+- journal_mode=WAL: readers no longer wait for writers, and a commit is an
+  append to the log instead of a rewrite of the journal. WAL is recorded in
+  the database file itself, which is why db.sqlite3 is not tracked in git;
+- synchronous=NORMAL: with WAL, fsync at checkpoints rather than every
+  commit. A power cut can lose the last commits but never corrupts the file;
+- busy_timeout: wait this many milliseconds for the write lock instead of
+  failing at once;
+- mmap_size / cache_size: read hot pages from memory (cache_size < 0 is KiB).
+
+Postgres needs nothing per connection; it gets persistent connections
+(CONN_MAX_AGE) with CONN_HEALTH_CHECKS instead.
+"""
+from django.conf import settings
+from django.db.backends.signals import connection_created
+
+
+def apply_pragmas(connection, pragmas):
+    # On the raw DB-API connection: these are not queries worth counting or logging.
+    for name, value in pragmas.items():
+        connection.connection.execute(f"PRAGMA {name} = {value}")
+
+
+def tune_connection(sender, connection, **kwargs):
+    if connection.vendor == "sqlite" and settings.SQLITE_PRAGMAS:
+        apply_pragmas(connection, settings.SQLITE_PRAGMAS)
+
+
+connection_created.connect(tune_connection)
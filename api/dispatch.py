@@ -0,0 +1,329 @@
+# api/dispatch.py
+"""
+Auto-dispatch for emergency requests (Request.dispatch=True).
+
+Instead of waiting for doctors to find the request in their feed, the
+dispatcher notifies the nearest doctors in waves: the WAVE_SIZE nearest
+doctors not notified yet, then WAVE_TIMEOUT_SECONDS to make an offer. The
+search starts at START_RADIUS_KM and doubles (up to MAX_RADIUS_KM) whenever
+it can't fill a wave, and later waves keep the wider radius. Dispatch stops
+when an offer arrives, the request closes, every doctor within MAX_RADIUS_KM
+has been asked, or MAX_WAVES waves have gone out.
+
+All pending waves live in a single priority queue (heapq, keyed on due time)
+served by one background thread, so thousands of open requests cost one
+sleeping thread and O(log n) per wave, not a poller per request. Cancelled
+jobs are dropped lazily when they reach the top of the heap.
+
+Jobs are held in the memory of the process that created the request. Offers
+handled by another process are still noticed: every wave re-checks the
+request in the database before notifying anyone. Each job's next due time is
+also kept on the request (Request.dispatch_due_at), so a job whose process
+went away (e.g. a worker recycled after gunicorn's max_requests) is not lost:
+a process hands its jobs back when it exits, and every dispatcher thread
+periodically falls back to the regular broadcast for requests whose next wave
+is a full WAVE_TIMEOUT_SECONDS overdue.
+"""
+import atexit
+import heapq
+import itertools
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from doctor_project.routers import pin_to_primary
+
+from . import events, feed, geo, locations, notifications
+from .models import DoctorProfile, Offer, Request
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "WAVE_SIZE": 5,
+    "WAVE_TIMEOUT_SECONDS": 45,
+    "START_RADIUS_KM": 3,
+    "MAX_RADIUS_KM": 50,
+    "MAX_WAVES": 8,
+}
+
+
+@dataclass
+class DispatchJob:
+    request_id: int
+    patient_id: int
+    latitude: float
+    longitude: float
+    symptoms: str
+    radius_km: float
+    wave: int = 0
+    notified: set = field(default_factory=set)
+
+
+class Dispatcher:
+    def __init__(self, wave_size=5, wave_timeout=45, start_radius_km=3, max_radius_km=50, max_waves=8,
+                 clock=time.monotonic, background=True):
+        self.wave_size = wave_size
+        self.wave_timeout = wave_timeout
+        self.start_radius_km = start_radius_km
+        self.max_radius_km = max_radius_km
+        self.max_waves = max_waves
+        # background=False leaves running due waves to the caller (run_pending), for tests and simulations.
+        self.clock = clock
+        self.background = background
+        self._heap = []  # (due, seq, request_id)
+        self._jobs = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._next_sweep = 0
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def start(self, request):
+        """Begin dispatching `request`; its first wave goes out immediately."""
+        job = DispatchJob(
+            request_id=request.id, patient_id=request.patient_id,
+            latitude=float(request.latitude), longitude=float(request.longitude),
+            symptoms=request.symptoms, radius_km=self.start_radius_km,
+        )
+        with self._cond:
+            self._jobs[job.request_id] = job
+            self._push(job.request_id, self.clock())
+            self._cond.notify()
+        if self.background:
+            self._ensure_thread()
+
+    def cancel(self, request_id):
+        """Stop dispatching (an offer arrived). Its heap entry is skipped when it comes due."""
+        with self._cond:
+            return self._jobs.pop(request_id, None) is not None
+
+    def start_background(self):
+        """Start the dispatch thread now (at worker boot), so lost jobs are swept right away."""
+        self.background = True
+        self._ensure_thread()
+
+    def release(self):
+        """
+        Hand every job this process holds back to the others (at exit): the
+        requests are marked overdue, so the next sweep anywhere broadcasts them.
+        """
+        with self._cond:
+            request_ids = list(self._jobs)
+            self._jobs.clear()
+        if request_ids:
+            overdue = timezone.now() - timedelta(seconds=self.wave_timeout)
+            _set_due(Request.objects.filter(id__in=request_ids, dispatch_due_at__isnull=False), overdue)
+            logger.info("Released %s dispatch jobs", len(request_ids))
+
+    def broadcast_lost(self):
+        """
+        Fall back to the regular broadcast for dispatched requests whose next wave
+        is a full timeout overdue: whichever process held them is gone. Returns
+        how many were broadcast.
+        """
+        cutoff = timezone.now() - timedelta(seconds=self.wave_timeout)
+        with self._cond:
+            own = set(self._jobs)
+        lost = (
+            Request.objects.filter(status='open', dispatch_due_at__lte=cutoff, offers__isnull=True)
+            .exclude(id__in=own)
+            .values_list('id', 'dispatch_due_at')
+        )
+        broadcast_ids = [
+            # Guarded on the due time we read, so only one process broadcasts each request.
+            request_id for request_id, due_at in lost
+            if _set_due(Request.objects.filter(id=request_id, dispatch_due_at=due_at), None)
+        ]
+        requests = Request.objects.only('id', 'patient_id', 'symptoms').in_bulk(broadcast_ids)
+        for row in feed.serialize_requests(feed.request_rows(Request.objects.filter(id__in=broadcast_ids))):
+            logger.warning("Dispatch for request %s was lost; broadcasting it instead", row['id'])
+            broadcast(requests[row['id']], row)
+        return len(broadcast_ids)
+
+    def run_pending(self, now=None):
+        """Run every wave that is due; returns how many ran."""
+        now = self.clock() if now is None else now
+        ran = 0
+        while True:
+            with self._cond:
+                job = self._pop_due(now)
+            if job is None:
+                return ran
+            self._run_wave(job)
+            ran += 1
+
+    def next_due(self):
+        with self._cond:
+            self._drop_cancelled()
+            return self._heap[0][0] if self._heap else None
+
+    # --- scheduling -------------------------------------------------------
+
+    def _push(self, request_id, due):
+        heapq.heappush(self._heap, (due, next(self._seq), request_id))
+
+    def _drop_cancelled(self):
+        while self._heap and self._heap[0][2] not in self._jobs:
+            heapq.heappop(self._heap)
+
+    def _pop_due(self, now):
+        self._drop_cancelled()
+        if not self._heap or self._heap[0][0] > now:
+            return None
+        _, _, request_id = heapq.heappop(self._heap)
+        return self._jobs[request_id]
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            with self._cond:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._loop, name="dispatch", daemon=True)
+                    self._thread.start()
+                    atexit.register(self.release)
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                self._drop_cancelled()
+                wake = min(self._heap[0][0], self._next_sweep) if self._heap else self._next_sweep
+                timeout = wake - self.clock()
+                if timeout > 0:
+                    self._cond.wait(timeout)
+                    continue
+            try:
+                if self.clock() >= self._next_sweep:
+                    self._next_sweep = self.clock() + self.wave_timeout
+                    self.broadcast_lost()
+                self.run_pending()
+            except Exception:
+                logger.exception("Dispatch wave failed")
+            finally:
+                connections.close_all()
+
+    # --- waves ------------------------------------------------------------
+
+    def _still_waiting(self, request_id):
+        # From the primary: a lagging replica would miss an offer made seconds ago.
+        with pin_to_primary():
+            # dispatch_due_at is cleared once another process has broadcast the request instead.
+            return (
+                Request.objects.filter(id=request_id, status='open', dispatch_due_at__isnull=False).exists()
+                and not Offer.objects.filter(request_id=request_id).exists()
+            )
+
+    def _candidates(self, job):
+        """The nearest doctors not notified yet, widening the job's radius until a wave is full."""
+        queryset = DoctorProfile.objects.exclude(user_id=job.patient_id)
+        # The buffer knows nothing about the request: keep a doctor-patient's own profile out of its fixes too.
+        own = set(DoctorProfile.objects.filter(user_id=job.patient_id).values_list('pk', flat=True))
+        while True:
+            matches = geo.nearby(queryset, job.latitude, job.longitude, job.radius_km)
+            # Doctors streaming their position are placed by their latest fix.
+            matches = locations.buffer.overlay(matches, job.latitude, job.longitude, job.radius_km)
+            fresh = [pk for pk, _ in matches if pk not in job.notified and pk not in own]
+            if len(fresh) >= self.wave_size or job.radius_km >= self.max_radius_km:
+                return fresh[:self.wave_size]
+            job.radius_km = min(job.radius_km * 2, self.max_radius_km)
+
+    def _run_wave(self, job):
+        if not self._still_waiting(job.request_id):
+            self.cancel(job.request_id)
+            _set_due(Request.objects.filter(id=job.request_id), None)
+            return
+
+        profile_ids = self._candidates(job)
+        job.wave += 1
+        job.notified.update(profile_ids)
+
+        if profile_ids:
+            doctor_ids = list(DoctorProfile.objects.filter(pk__in=profile_ids).values_list('user_id', flat=True))
+            notifications.notify(
+                notifications.users(doctor_ids),
+                "Urgent request near you",
+                job.symptoms[:100],
+                {"type": "request.dispatch", "request_id": job.request_id, "wave": job.wave},
+            )
+        events.publish(
+            events.patient_channel(job.patient_id),
+            'request.dispatch',
+            {"request_id": job.request_id, "wave": job.wave, "doctors_notified": len(job.notified)},
+        )
+
+        with self._cond:
+            if job.request_id not in self._jobs:
+                return  # cancelled while this wave was running
+            if job.wave >= self.max_waves or not profile_ids:
+                # Out of waves, or every doctor within MAX_RADIUS_KM has been asked.
+                del self._jobs[job.request_id]
+                ended = True
+            else:
+                ended = False
+
+        pending = Request.objects.filter(id=job.request_id, dispatch_due_at__isnull=False)
+        if ended:
+            _set_due(pending, None)
+            logger.info("Dispatch for request %s ended after %s waves", job.request_id, job.wave)
+        elif not _set_due(pending, timezone.now() + timedelta(seconds=self.wave_timeout)):
+            # Another process already gave up on this job and broadcast the request.
+            self.cancel(job.request_id)
+        else:
+            with self._cond:
+                if job.request_id in self._jobs:
+                    self._push(job.request_id, self.clock() + self.wave_timeout)
+                    self._cond.notify()
+
+
+def _set_due(queryset, due_at):
+    # Dispatch bookkeeping isn't a change delta-sync clients need to see, so keep the version.
+    return queryset.update(dispatch_due_at=due_at, version=F('version'), updated_at=F('updated_at'))
+
+
+def broadcast(request, data):
+    """The regular path for a new request: every doctor's live feed and phone."""
+    events.publish(events.REQUESTS_CHANNEL, 'request.created', data)
+    notifications.notify(
+        notifications.doctors() & ~notifications.user(request.patient_id),
+        "New patient request",
+        request.symptoms[:100],
+        {"type": "request.created", "request_id": request.id},
+    )
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                config = {**DEFAULTS, **getattr(settings, "DISPATCH", {})}
+                _dispatcher = Dispatcher(
+                    wave_size=config["WAVE_SIZE"],
+                    wave_timeout=config["WAVE_TIMEOUT_SECONDS"],
+                    start_radius_km=config["START_RADIUS_KM"],
+                    max_radius_km=config["MAX_RADIUS_KM"],
+                    max_waves=config["MAX_WAVES"],
+                )
+    return _dispatcher
+
+
+def dispatch(request):
+    """Start dispatching `request` to nearby doctors once the current transaction commits."""
+    _set_due(Request.objects.filter(id=request.id), timezone.now())
+    transaction.on_commit(lambda: get_dispatcher().start(request))
+
+
+def cancel(request_id):
+    """Stop dispatching `request_id` once the current transaction commits (an offer arrived)."""
+    transaction.on_commit(lambda: get_dispatcher().cancel(request_id))
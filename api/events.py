@@ -0,0 +1,96 @@
+# api/events.py
+"""
+Publish/subscribe for the live event stream (see api/streams.py).
+
+Views publish small JSON events to named channels:
+  - "requests"            new/closed requests, for every doctor's feed
+  - "patient:<user_id>"   new/accepted offers, for the patient who owns the request
+
+The default InProcessBroker only reaches subscribers connected to the same
+process. Point settings.EVENT_BROKER at another class with the same
+publish/subscribe/unsubscribe methods to fan out through an external broker.
+"""
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+REQUESTS_CHANNEL = "requests"
+
+
+def patient_channel(user_id):
+    return f"patient:{user_id}"
+
+
+class Subscriber:
+    def __init__(self, channels, loop, maxsize):
+        self.channels = tuple(channels)
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=maxsize)
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # A stalled client must not grow memory without bound; it can re-sync by polling.
+            logger.warning("Dropping event for slow subscriber on %s", self.channels)
+
+
+class InProcessBroker:
+    """Fan events out to asyncio queues of subscribers living in this process."""
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, channels):
+        # Must be called from the event loop that will consume the queue.
+        subscriber = Subscriber(channels, asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            for channel in subscriber.channels:
+                self._subscribers[channel].add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            for channel in subscriber.channels:
+                self._subscribers[channel].discard(subscriber)
+                if not self._subscribers[channel]:
+                    del self._subscribers[channel]
+
+    def publish(self, channel, event):
+        # Safe to call from sync views running in worker threads.
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber._put, event)
+            except RuntimeError:
+                # The subscriber's loop has shut down; it will unsubscribe itself.
+                pass
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(getattr(settings, "EVENT_BROKER", "api.events.InProcessBroker"))()
+    return _broker
+
+
+def publish(channel, event_type, data):
+    """Publish an event once the current transaction commits (immediately in autocommit)."""
+    event = {"type": event_type, "data": data}
+    transaction.on_commit(lambda: get_broker().publish(channel, event))
@@ -0,0 +1,59 @@
+# api/firebase.py
+"""
+Lazy, thread-safe access to the Firebase Admin SDK.
+
+Importing firebase_admin pulls in the whole Google client stack, which most
+processes (migrations, management commands, workers that never see a token)
+don't need. The SDK is imported and the default app initialized the first
+time something asks for it. Under gunicorn's preload_app, call warm_up() in
+the master so forked workers share the already-imported modules; no network
+connection is opened until the first token is verified.
+"""
+import logging
+import os
+import threading
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_ready = None  # None: not tried yet; True/False: whether the default app is usable
+
+
+def initialize():
+    """Import the SDK and initialize the default app once per process. Returns True if it is usable."""
+    global _ready
+    if _ready is None:
+        with _lock:
+            if _ready is None:
+                _ready = _initialize()
+    return _ready
+
+
+def _initialize():
+    import firebase_admin
+    from firebase_admin import credentials
+
+    if firebase_admin._apps:
+        return True
+    key_path = getattr(settings, "FIREBASE_CREDENTIAL_PATH", None)
+    if key_path and os.path.exists(key_path):
+        firebase_admin.initialize_app(credentials.Certificate(key_path))
+        return True
+    # Don't crash the app when the key is missing; authentication will fail instead.
+    logger.warning("Firebase credential file not found (%s). Firebase auth will not work.", key_path)
+    return False
+
+
+def verify_id_token(id_token):
+    from firebase_admin import auth
+
+    return auth.verify_id_token(id_token)
+
+
+def warm_up():
+    """Pay the SDK import and app initialization cost now (e.g. in a preloading gunicorn master)."""
+    from firebase_admin import auth, messaging  # noqa: F401
+
+    return initialize()
@@ -0,0 +1,134 @@
+# api/geo.py
+"""
+Geohash-based proximity search that works on plain SQLite/Postgres (no PostGIS).
+
+Every located row stores a geohash in an indexed column. A radius query picks
+the coarsest geohash precision whose cells are at least as big as the radius,
+turns the 3x3 block of cells around the query point into indexed range
+filters, and then refines the (small) candidate set with the haversine formula.
+"""
+import math
+
+from django.db.models import Q
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 9  # ~5m x 5m cells; what we store on each row
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+
+
+def encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bit = 0
+    ch = 0
+    even = True
+    while len(chars) < precision:
+        rng, value = (lng_range, longitude) if even else (lat_range, latitude)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            ch = (ch << 1) | 1
+            rng[0] = mid
+        else:
+            ch = ch << 1
+            rng[1] = mid
+        even = not even
+        bit += 1
+        if bit == 5:
+            chars.append(BASE32[ch])
+            bit = 0
+            ch = 0
+    return "".join(chars)
+
+
+def cell_size_degrees(precision):
+    """Return (height, width) in degrees of a geohash cell at this precision."""
+    bits = 5 * precision
+    lng_bits = (bits + 1) // 2
+    lat_bits = bits // 2
+    return 180.0 / (2 ** lat_bits), 360.0 / (2 ** lng_bits)
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (float(lat1), float(lng1), float(lat2), float(lng2)))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def covering_cells(latitude, longitude, radius_km):
+    """
+    Return the geohash prefixes whose union contains every point within
+    radius_km of (latitude, longitude). An empty list means "no usable
+    prefix" (radius too large or too close to a pole) and callers must scan.
+    """
+    # Cells get narrower away from the equator; size them for the worst latitude we may reach.
+    worst_lat = min(89.9, abs(latitude) + radius_km / KM_PER_DEGREE)
+    lng_km_per_degree = KM_PER_DEGREE * math.cos(math.radians(worst_lat))
+
+    precision = 0
+    for p in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size_degrees(p)
+        if height * KM_PER_DEGREE >= radius_km and width * lng_km_per_degree >= radius_km:
+            precision = p
+            break
+    if not precision:
+        return []
+
+    height, width = cell_size_degrees(precision)
+    cells = []
+    for dy in (-1, 0, 1):
+        lat = max(-90.0, min(90.0 - 1e-9, latitude + dy * height))
+        for dx in (-1, 0, 1):
+            lng = (longitude + dx * width + 180.0) % 360.0 - 180.0
+            cell = encode(lat, lng, precision)
+            if cell not in cells:
+                cells.append(cell)
+    return cells
+
+
+def cells_filter(cells, field="geohash", **scope):
+    """
+    Turn geohash prefixes into index-friendly range lookups (prefix <= x < prefix + '{').
+    Lookups in `scope` are repeated inside every range, so a composite index
+    such as (status, geohash) can serve each one.
+    """
+    query = Q()
+    for cell in cells:
+        # '{' sorts right after 'z', the last geohash character.
+        query |= Q(**scope, **{f"{field}__gte": cell, f"{field}__lt": cell + "{"})
+    return query
+
+
+def nearby(queryset, latitude, longitude, radius_km, limit=None, scope=None):
+    """
+    Return [(pk, distance_km), ...] for rows of queryset (narrowed by the
+    `scope` lookups) within radius_km, nearest first. Only the candidate cells
+    are read from the database.
+    """
+    scope = scope or {}
+    cells = covering_cells(latitude, longitude, radius_km)
+    queryset = queryset.filter(cells_filter(cells, **scope)) if cells else queryset.filter(**scope)
+
+    matches = []
+    for pk, lat, lng in queryset.values_list("pk", "latitude", "longitude").iterator():
+        distance = haversine_km(latitude, longitude, lat, lng)
+        if distance <= radius_km:
+            matches.append((pk, distance))
+    matches.sort(key=lambda match: match[1])
+    return matches[:limit] if limit is not None else matches
+
+
+def nearest(queryset, latitude, longitude, k, max_radius_km, start_radius_km=1.0, scope=None):
+    """
+    Return the k nearest rows as [(pk, distance_km), ...], widening the search
+    radius until k rows are found or max_radius_km is reached.
+    """
+    radius = min(start_radius_km, max_radius_km)
+    while True:
+        matches = nearby(queryset, latitude, longitude, radius, scope=scope)
+        # Everything within `radius` has been seen, so once we have k matches
+        # the k closest are guaranteed to be among them.
+        if len(matches) >= k or radius >= max_radius_km:
+            return matches[:k]
+        radius = min(radius * 4, max_radius_km)
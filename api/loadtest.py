@@ -0,0 +1,187 @@
+# api/loadtest.py
+"""
+HTTP load-test harness behind `manage.py loadtest`.
+
+Simulated patients, doctors and USSD subscribers drive the real endpoints
+over HTTP from a pool of threads, in a weighted mix, for a fixed duration.
+Everything (seeding included) goes through the public API, so the same run
+works against the in-process server the command boots or against any
+staging deployment started with LOADTEST_TARGET=True and
+FIREBASE_TOKEN_VERIFIER="api.loadtest.verify_stub_token".
+"""
+import itertools
+import random
+import threading
+import time
+from collections import defaultdict
+
+from .benchmark import percentiles
+
+STUB_TOKEN_PREFIX = "loadtest:"
+
+# Relative frequency of each operation in the mix.
+WEIGHTS = {
+    "feed": 40,
+    "create_request": 10,
+    "create_offer": 15,
+    "accept_offer": 5,
+    "ussd": 15,
+    "subscription_status": 15,
+}
+
+
+def verify_stub_token(id_token):
+    """Stand-in for firebase_auth.verify_id_token: "loadtest:<uid>" is a valid token for <uid>."""
+    if not id_token.startswith(STUB_TOKEN_PREFIX):
+        raise ValueError("Not a load-test token.")
+    return {"uid": id_token[len(STUB_TOKEN_PREFIX):], "exp": int(time.time()) + 3600}
+
+
+def token(uid):
+    return STUB_TOKEN_PREFIX + uid
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def add(self, endpoint, elapsed, ok):
+        with self._lock:
+            self.samples[endpoint].append(elapsed)
+            if not ok:
+                self.errors[endpoint] += 1
+
+    def summary(self, wall):
+        endpoints = {}
+        for endpoint in sorted(self.samples):
+            samples = self.samples[endpoint]
+            endpoints[endpoint] = {
+                **percentiles(samples),
+                "errors": self.errors[endpoint],
+                "rps": round(len(samples) / wall, 1),
+            }
+        everything = [s for samples in self.samples.values() for s in samples]
+        total = {**percentiles(everything), "errors": sum(self.errors.values()), "rps": round(len(everything) / wall, 1)}
+        return endpoints, total
+
+
+class LoadTest:
+    def __init__(self, base_url, patients=50, doctors=20, seed_requests=100, seed=0):
+        self.base_url = base_url.rstrip("/")
+        self.rng = random.Random(seed)
+        self.run_id = f"{seed}-{int(time.time())}"
+        self.patients = [f"lt-patient-{self.run_id}-{i}" for i in range(patients)]
+        self.doctors = [f"lt-doctor-{self.run_id}-{i}" for i in range(doctors)]
+        self.seed_requests = seed_requests
+        self.recorder = Recorder()
+        # (request id, patient uid) still open; (offer id, request id, patient uid) still pending
+        self.open_requests = []
+        self.pending_offers = []
+        self._lock = threading.Lock()
+        self._ussd_sessions = itertools.count()
+
+    # --- plumbing ---------------------------------------------------------
+
+    def _call(self, http, endpoint, method, path, uid=None, record=True, expected=(), **kwargs):
+        headers = {"Authorization": f"Bearer {token(uid)}"} if uid else {}
+        start = time.perf_counter()
+        try:
+            response = http.request(method, self.base_url + path, headers=headers, timeout=30, **kwargs)
+        except Exception:
+            if record:
+                self.recorder.add(endpoint, time.perf_counter() - start, False)
+            return None
+        if record:
+            ok = response.status_code < 400 or response.status_code in expected
+            self.recorder.add(endpoint, time.perf_counter() - start, ok)
+        return response
+
+    def seed(self):
+        """Register doctors and open the initial requests, through the API (not timed)."""
+        import requests
+
+        http = requests.Session()
+        for i, uid in enumerate(self.doctors):
+            self._call(http, "seed", "POST", "/api/doctors/register/", uid, record=False, json={
+                "full_name": f"Load Doctor {i}", "phone_number": f"+2557{i:08}", "region": "Dar es Salaam",
+                "latitude": -6.8 + self.rng.uniform(-0.1, 0.1), "longitude": 39.28 + self.rng.uniform(-0.1, 0.1),
+            })
+        for _ in range(self.seed_requests):
+            self.create_request(http, record=False)
+
+    # --- operations -------------------------------------------------------
+
+    def feed(self, http):
+        self._call(http, "feed", "GET", "/api/requests/?page_size=50", self.rng.choice(self.doctors))
+
+    def create_request(self, http, record=True):
+        patient = self.rng.choice(self.patients)
+        response = self._call(http, "create_request", "POST", "/api/requests/", patient, record=record, json={
+            "symptoms": "Fever and headache",
+            "latitude": round(-6.8 + self.rng.uniform(-0.1, 0.1), 6),
+            "longitude": round(39.28 + self.rng.uniform(-0.1, 0.1), 6),
+        })
+        if response is not None and response.status_code == 201:
+            with self._lock:
+                self.open_requests.append((response.json()["id"], patient))
+
+    def create_offer(self, http):
+        with self._lock:
+            target = self.rng.choice(self.open_requests) if self.open_requests else None
+        if target is None:
+            return self.create_request(http)
+        request_id, patient = target
+        response = self._call(http, "create_offer", "POST", f"/api/requests/{request_id}/offers/",
+                              self.rng.choice(self.doctors), json={"price": "15000.00", "eta_minutes": 20})
+        if response is not None and response.status_code == 201:
+            with self._lock:
+                self.pending_offers.append((response.json()["offer_id"], request_id, patient))
+
+    def accept_offer(self, http):
+        with self._lock:
+            target = self.pending_offers.pop(self.rng.randrange(len(self.pending_offers))) if self.pending_offers else None
+        if target is None:
+            return self.create_offer(http)
+        offer_id, request_id, patient = target
+        # 409: another worker accepted a different offer on the same request first.
+        response = self._call(http, "accept_offer", "POST", f"/api/offers/{offer_id}/accept/", patient, expected=(409,))
+        if response is not None and response.status_code == 200:
+            # The request is closed now, along with every other offer on it.
+            with self._lock:
+                self.open_requests = [r for r in self.open_requests if r[0] != request_id]
+                self.pending_offers = [o for o in self.pending_offers if o[1] != request_id]
+
+    def ussd(self, http):
+        session_id = f"lt-{self.run_id}-{next(self._ussd_sessions)}"
+        phone = f"+2556{self.rng.randrange(10 ** 8):08}"
+        for text in ("", "2"):
+            self._call(http, "ussd", "POST", "/api/subscriptions/ussd-menu/",
+                       data={"sessionId": session_id, "phoneNumber": phone, "text": text})
+
+    def subscription_status(self, http):
+        self._call(http, "subscription_status", "GET", "/api/subscriptions/status/", self.rng.choice(self.patients))
+
+    # --- driver -----------------------------------------------------------
+
+    def run(self, duration, concurrency):
+        import requests
+
+        operations = list(WEIGHTS)
+        weights = [WEIGHTS[op] for op in operations]
+        deadline = time.perf_counter() + duration
+
+        def worker(worker_id):
+            http = requests.Session()
+            rng = random.Random(worker_id)
+            while time.perf_counter() < deadline:
+                getattr(self, rng.choices(operations, weights)[0])(http)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.recorder.summary(time.perf_counter() - started)
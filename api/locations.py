@@ -0,0 +1,143 @@
+# api/locations.py
+"""
+Write-coalescing buffer for doctors' live location pings.
+
+On shift, every doctor's app POSTs its position every few seconds. Writing each
+ping would be one UPDATE per ping; instead the buffer keeps only the latest fix
+per doctor in memory and a background flusher writes them all with a single
+bulk_update every LOCATION_FLUSH_INTERVAL seconds, or sooner once
+LOCATION_FLUSH_SIZE doctors are pending. "Nearby doctor" lookups overlay the
+buffered fixes on the database results, so they are never staler than the
+latest ping this process has seen.
+
+Positions are per process: with several workers, a doctor's unflushed fix is
+only visible to the worker that received it until the next flush.
+"""
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connections
+
+from . import geo
+from .cache import TTLCache
+from .models import DoctorProfile
+
+logger = logging.getLogger(__name__)
+
+
+class LocationBuffer:
+    def __init__(self, flush_interval=5.0, max_pending=500):
+        # flush_interval=0 disables the background flusher: rows are only
+        # written when max_pending is reached or flush() is called (tests).
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.pings = 0
+        self.rows_written = 0
+        self._pending = {}   # profile id -> (latitude, longitude)
+        self._flushing = {}  # taken by the running flush, still visible to readers
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def record(self, profile_id, latitude, longitude):
+        with self._lock:
+            self._pending[profile_id] = (latitude, longitude)
+            self.pings += 1
+            full = len(self._pending) >= self.max_pending
+
+        if not self.flush_interval:
+            if full:
+                self.flush()
+            return
+        self._ensure_flusher()
+        if full:
+            self._wake.set()
+
+    def positions(self):
+        """Every buffered fix not yet visible in the database, as {profile id: (lat, lng)}."""
+        with self._lock:
+            return {**self._flushing, **self._pending}
+
+    def flush(self):
+        """Write all pending fixes with one bulk_update. Returns the number of rows sent."""
+        with self._flush_lock:
+            with self._lock:
+                self._flushing, self._pending = self._pending, {}
+                batch = self._flushing
+            if not batch:
+                return 0
+            try:
+                profiles = [
+                    DoctorProfile(pk=pk, latitude=lat, longitude=lng, geohash=geo.encode(lat, lng))
+                    for pk, (lat, lng) in batch.items()
+                ]
+                DoctorProfile.objects.bulk_update(
+                    profiles, ["latitude", "longitude", "geohash"], batch_size=self.max_pending
+                )
+            except Exception:
+                # Put the fixes back unless a newer ping has replaced them meanwhile.
+                with self._lock:
+                    self._pending = {**batch, **self._pending}
+                raise
+            finally:
+                with self._lock:
+                    self._flushing = {}
+            self.rows_written += len(profiles)
+            return len(profiles)
+
+    def overlay(self, matches, latitude, longitude, radius_km, limit=None):
+        """
+        Correct [(pk, distance_km), ...] from the database with the buffered
+        fixes: doctors that moved are re-measured (and dropped if now out of
+        range), buffered doctors the database doesn't place nearby yet are added.
+        """
+        positions = self.positions()
+        if not positions:
+            return matches
+        merged = [(pk, distance) for pk, distance in matches if pk not in positions]
+        for pk, (lat, lng) in positions.items():
+            distance = geo.haversine_km(latitude, longitude, lat, lng)
+            if distance <= radius_km:
+                merged.append((pk, distance))
+        merged.sort(key=lambda match: match[1])
+        return merged[:limit] if limit is not None else merged
+
+    def _ensure_flusher(self):
+        if self._thread is None:
+            with self._flush_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="location-flush", daemon=True)
+                    self._thread.start()
+                    atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Flushing doctor locations failed")
+            finally:
+                connections.close_all()
+
+
+buffer = LocationBuffer(
+    flush_interval=getattr(settings, "LOCATION_FLUSH_INTERVAL", 5.0),
+    max_pending=getattr(settings, "LOCATION_FLUSH_SIZE", 500),
+)
+
+# user id -> DoctorProfile id, so a ping doesn't need a lookup query
+profile_ids = TTLCache(maxsize=getattr(settings, "LOCATION_FLUSH_SIZE", 500) * 4, ttl=600)
+
+
+def profile_id_for(user_id):
+    profile_id = profile_ids.get(user_id)
+    if profile_id is None:
+        profile_id = DoctorProfile.objects.filter(user_id=user_id).values_list("pk", flat=True).first()
+        if profile_id is not None:
+            profile_ids.set(user_id, profile_id)
+    return profile_id
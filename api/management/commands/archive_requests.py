@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.archive import archive_requests
+
+
+class Command(BaseCommand):
+    help = (
+        "Move requests closed more than --days ago, with their offers, into the archive tables "
+        "in batches of one transaction each (run from cron; safe to interrupt and re-run)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=settings.ARCHIVE_AFTER_DAYS)
+        parser.add_argument("--batch-size", type=int, default=settings.ARCHIVE_BATCH_SIZE)
+        parser.add_argument("--max-batches", type=int, help="Stop after this many batches (default: until done).")
+        parser.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between batches.")
+
+    def handle(self, *args, **options):
+        requests, offers = archive_requests(
+            options["days"], options["batch_size"], options["max_batches"], options["pause"],
+            log=self.stdout.write if options["verbosity"] > 1 else None,
+        )
+        self.stdout.write(f"Archived {requests} request(s) and {offers} offer(s).")
@@ -0,0 +1,77 @@
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connections
+from rest_framework.test import APIClient
+
+from api import notifications
+from api.benchmark import percentiles, scratch_database
+from api.models import DoctorProfile, Offer, Request
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Measure OfferAcceptView latency when several accepts for the same request race."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=50, help="Requests to accept (one race each).")
+        parser.add_argument("--offers", type=int, default=8, help="Offers per request, all accepted in parallel.")
+
+    def handle(self, *args, **options):
+        # 404/409 responses are expected here; don't log each one.
+        logging.getLogger("django.request").setLevel(logging.ERROR)
+        # Don't let FCM calls skew the numbers.
+        notifications._notifier = notifications.Notifier(notifications.FakeTransport(), workers=0)
+
+        with scratch_database():
+            patient = User.objects.create(username="bench-patient")
+            doctors = []
+            for i in range(options["offers"]):
+                doctor = User.objects.create(username=f"bench-doctor-{i}")
+                DoctorProfile.objects.create(user=doctor, full_name=f"Doctor {i}", phone_number="1", region="R")
+                doctors.append(doctor)
+
+            races = []
+            for _ in range(options["requests"]):
+                req = Request.objects.create(patient=patient, symptoms="bench", latitude=0, longitude=0)
+                races.append([
+                    Offer.objects.create(request=req, doctor=doctor, price=100, eta_minutes=5) for doctor in doctors
+                ])
+
+            latencies, codes = [], Counter()
+            lock = threading.Lock()
+
+            def accept(offer, barrier):
+                client = APIClient()
+                client.force_authenticate(patient)
+                try:
+                    barrier.wait()
+                    start = time.perf_counter()
+                    code = client.post(f"/api/offers/{offer.id}/accept/").status_code
+                    elapsed = time.perf_counter() - start
+                    with lock:
+                        latencies.append(elapsed)
+                        codes[code] += 1
+                finally:
+                    connections.close_all()
+
+            started = time.perf_counter()
+            for offers in races:
+                barrier = threading.Barrier(len(offers))
+                threads = [threading.Thread(target=accept, args=(offer, barrier)) for offer in offers]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+            wall = time.perf_counter() - started
+
+            winners = Offer.objects.filter(status="accepted").count()
+
+        self.stdout.write(f"races={len(races)} attempts/race={options['offers']} wall={wall:.2f}s")
+        self.stdout.write(f"status codes: {dict(codes)}  accepted offers: {winners} (expected {len(races)})")
+        self.stdout.write(f"latency: {percentiles(latencies)}")
@@ -0,0 +1,140 @@
+import json
+import logging
+import random
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from api import notifications
+from api.benchmark import percentiles, scratch_database
+from api.datagen import DataGenerator
+from api.models import Request
+
+User = get_user_model()
+
+# SQLite's defaults, and Django's CONN_MAX_AGE=0 (a new connection per request).
+BASELINE = {
+    "pragmas": {"journal_mode": "DELETE", "synchronous": "FULL", "mmap_size": 0, "cache_size": -2000},
+    "transaction_mode": None,
+    "persistent": False,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Concurrent OfferCreateView posts (with feed readers alongside) against SQLite, first "
+        "with SQLite's and Django's defaults, then with the settings in DATABASES/SQLITE_PRAGMAS."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--writers", type=int, default=8, help="Threads posting offers.")
+        parser.add_argument("--readers", type=int, default=4, help="Threads reading the requests feed.")
+        parser.add_argument("--duration", type=float, default=10, help="Seconds per configuration.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Write the results as JSON to this file.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("This benchmark compares SQLite configurations.")
+        # Failed writes are counted, not logged one by one; don't let FCM calls skew the numbers.
+        logging.getLogger("django.request").setLevel(logging.CRITICAL)
+        notifications._notifier = notifications.Notifier(notifications.FakeTransport(), workers=0)
+
+        tuned = {
+            "pragmas": settings.SQLITE_PRAGMAS,
+            "transaction_mode": settings.DATABASES["default"].get("OPTIONS", {}).get("transaction_mode"),
+            "persistent": settings.DATABASES["default"]["CONN_MAX_AGE"] != 0,
+        }
+        results = {}
+        with scratch_database():
+            generator = DataGenerator(seed=options["seed"])
+            generator.doctors(max(options["writers"], options["readers"]) * 5)
+            generator.patients(100)
+            generator.requests(2000)
+            self.doctors = list(generator.doctor_ids)
+            self.open_ids = list(Request.objects.filter(status="open").values_list("id", flat=True))
+
+            self.stdout.write(f"{options['writers']} writers, {options['readers']} readers, "
+                              f"{options['duration']:.0f}s per configuration")
+            self.stdout.write(f"{'config':<10}{'writes/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'failed':>8}"
+                              f"{'reads/s':>10}{'p99 ms':>10}")
+            for name, config in (("baseline", BASELINE), ("tuned", tuned)):
+                results[name] = self.run(config, options)
+                writes, reads = results[name]["writes"], results[name]["reads"]
+                self.stdout.write(
+                    f"{name:<10}{writes['rps']:>10}{writes.get('p50_ms', '-'):>10}{writes.get('p99_ms', '-'):>10}"
+                    f"{writes['failed']:>8}{reads['rps']:>10}{reads.get('p99_ms', '-'):>10}"
+                )
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def run(self, config, options):
+        users = User.objects.in_bulk(self.doctors)
+        db_options = connection.settings_dict.setdefault("OPTIONS", {})
+        saved_mode = db_options.get("transaction_mode")
+        db_options["transaction_mode"] = config["transaction_mode"]
+        connections.close_all()
+        try:
+            with override_settings(SQLITE_PRAGMAS=config["pragmas"]):
+                # journal_mode sticks to the file: switch it with no other connection open.
+                connection.ensure_connection()
+                connection.close()
+                return self.drive(users, config["persistent"], options)
+        finally:
+            db_options["transaction_mode"] = saved_mode
+            connections.close_all()
+
+    def drive(self, users, persistent, options):
+        samples = {"writes": [], "reads": []}
+        failed = Counter()
+        lock = threading.Lock()
+        deadline = time.perf_counter() + options["duration"]
+
+        def worker(kind, seed):
+            rng = random.Random(seed)
+            client = APIClient(raise_request_exception=False)
+            try:
+                while time.perf_counter() < deadline:
+                    client.force_authenticate(users[rng.choice(self.doctors)])
+                    start = time.perf_counter()
+                    try:
+                        if kind == "writes":
+                            response = client.post(f"/api/requests/{rng.choice(self.open_ids)}/offers/",
+                                                   {"price": "15000.00", "eta_minutes": 20})
+                        else:
+                            response = client.get("/api/requests/?page_size=50")
+                        ok = response.status_code < 400
+                    except Exception:
+                        ok = False
+                    elapsed = time.perf_counter() - start
+                    with lock:
+                        samples[kind].append(elapsed)
+                        failed[kind] += not ok
+                    if not persistent:
+                        connection.close()
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker, args=("writes", i)) for i in range(options["writers"])]
+        threads += [threading.Thread(target=worker, args=("reads", 1000 + i)) for i in range(options["readers"])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - started
+
+        return {
+            kind: {**percentiles(samples[kind]), "rps": round(len(samples[kind]) / wall, 1), "failed": failed[kind]}
+            for kind in samples
+        }
@@ -0,0 +1,195 @@
+import heapq
+import json
+import random
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api import geo, notifications
+from api.benchmark import percentiles, scratch_database
+from api.datagen import CITIES, DataGenerator
+from api.dispatch import DEFAULTS, Dispatcher
+from api.models import Offer, Request, next_version
+
+
+class RespondingDoctors(notifications.FakeTransport):
+    """Instead of sending pushes, decide which notified doctors will answer with an offer, and when."""
+
+    def __init__(self, simulation):
+        super().__init__()
+        self.simulation = simulation
+
+    def send_multicast(self, tokens, title, body, data):
+        sim = self.simulation
+        for token in tokens:
+            if sim.rng.random() < sim.response_rate:
+                doctor_id = int(token.rsplit("-d", 1)[1])
+                sim.schedule(sim.now + sim.rng.uniform(*sim.response_delay), "offer", data["request_id"], doctor_id)
+        return []
+
+
+class Command(BaseCommand):
+    help = (
+        "Simulate auto-dispatch (api/dispatch.py) for many concurrent emergency requests on a "
+        "simulated clock: generated doctors answer a share of the notifications after a random "
+        "delay. Reports time to first offer, waves per request and the real cost of each wave, "
+        "plus the cost of the scheduler itself with many jobs pending."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--doctors", type=int, default=2000)
+        parser.add_argument("--requests", type=int, default=2000, help="Dispatch requests to simulate.")
+        parser.add_argument("--arrival-window", type=float, default=600,
+                            help="Requests arrive uniformly over this many simulated seconds.")
+        parser.add_argument("--response-rate", type=float, default=0.1,
+                            help="Share of notified doctors who make an offer.")
+        parser.add_argument("--response-delay", type=float, nargs=2, default=[15, 120], metavar=("MIN", "MAX"),
+                            help="Simulated seconds between a notification and the doctor's offer.")
+        parser.add_argument("--wave-size", type=int, default=DEFAULTS["WAVE_SIZE"])
+        parser.add_argument("--wave-timeout", type=float, default=DEFAULTS["WAVE_TIMEOUT_SECONDS"])
+        parser.add_argument("--scheduler-jobs", type=int, nargs="+", default=[1000, 10000, 100000],
+                            help="Pending job counts for the scheduler-only measurement.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Write the results as JSON to this file.")
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options["seed"])
+        self.response_rate = options["response_rate"]
+        self.response_delay = options["response_delay"]
+        self.now = 0.0
+        self.events = []  # (time, seq, kind, *args)
+        self.seq = 0
+        notifications._notifier = notifications.Notifier(RespondingDoctors(self), workers=0)
+
+        results = {"scheduler": self.bench_scheduler(options["scheduler_jobs"])}
+        with scratch_database():
+            results["simulation"] = self.simulate(options)
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def schedule(self, at, kind, *args):
+        self.seq += 1
+        heapq.heappush(self.events, (at, self.seq, kind, *args))
+
+    def simulate(self, options):
+        generator = DataGenerator(seed=options["seed"])
+        generator.doctors(options["doctors"])
+        generator.patients(max(1, options["requests"] // 10))
+
+        requests = []
+        for _ in range(options["requests"]):
+            _, lat, lng, spread, _ = self.rng.choice(CITIES)
+            lat, lng = round(self.rng.gauss(lat, spread), 6), round(self.rng.gauss(lng, spread), 6)
+            requests.append(Request(
+                patient_id=self.rng.choice(generator.patient_ids), symptoms="Chest pain", dispatch=True,
+                latitude=lat, longitude=lng, geohash=geo.encode(lat, lng), version=next_version(),
+                dispatch_due_at=timezone.now(),  # as api.dispatch.dispatch() sets it
+            ))
+        for request in Request.objects.bulk_create(requests):
+            self.schedule(self.rng.uniform(0, options["arrival_window"]), "start", request)
+
+        dispatcher = Dispatcher(
+            wave_size=options["wave_size"], wave_timeout=options["wave_timeout"],
+            start_radius_km=DEFAULTS["START_RADIUS_KM"], max_radius_km=DEFAULTS["MAX_RADIUS_KM"],
+            max_waves=DEFAULTS["MAX_WAVES"], clock=lambda: self.now, background=False,
+        )
+        started, first_offer, waves = {}, {}, Counter()
+        wave_samples, peak = [], 0
+        wall = time.perf_counter()
+        while self.events or dispatcher.next_due() is not None:
+            due = dispatcher.next_due()
+            if due is not None and (not self.events or due <= self.events[0][0]):
+                self.now = due
+                # Waves due at the same instant run together; time each one.
+                while dispatcher.next_due() == due:
+                    start = time.perf_counter()
+                    job = dispatcher._pop_due(due)
+                    if job is None:
+                        break
+                    dispatcher._run_wave(job)
+                    wave_samples.append(time.perf_counter() - start)
+                    waves[job.request_id] = job.wave
+                continue
+
+            self.now, _, kind, *args = heapq.heappop(self.events)
+            if kind == "start":
+                request = args[0]
+                started[request.id] = self.now
+                dispatcher.start(request)
+                peak = max(peak, len(dispatcher))
+            elif kind == "offer":
+                request_id, doctor_id = args
+                if request_id in first_offer:
+                    continue
+                # What OfferCreateView does: record the offer, stop dispatching.
+                Offer.objects.create(request_id=request_id, doctor_id=doctor_id, price=15000, eta_minutes=20)
+                dispatcher.cancel(request_id)
+                first_offer[request_id] = self.now - started[request_id]
+        wall = time.perf_counter() - wall
+
+        answered = sorted(first_offer.values())
+
+        def quantile(p):
+            return round(answered[min(len(answered) - 1, int(p / 100 * len(answered)))], 1) if answered else None
+
+        result = {
+            "requests": len(started),
+            "answered": len(answered),
+            "peak_pending": peak,
+            "time_to_first_offer_s": {"p50": quantile(50), "p90": quantile(90), "p99": quantile(99)},
+            "waves_per_request": dict(sorted(Counter(waves.values()).items())),
+            "wave_cost": percentiles(wave_samples),
+            "wall_s": round(wall, 2),
+        }
+        self.stdout.write(
+            f"\n{result['requests']} dispatch requests, {options['doctors']} doctors, "
+            f"peak {peak} dispatching at once"
+        )
+        self.stdout.write(f"answered: {len(answered)} ({len(answered) / max(1, len(started)):.0%})")
+        self.stdout.write(f"time to first offer (simulated s): {result['time_to_first_offer_s']}")
+        self.stdout.write(f"waves per request: {result['waves_per_request']}")
+        cost = result["wave_cost"]
+        self.stdout.write(
+            f"wave cost (real, DB included): {cost['count']} waves, p50 {cost['p50_ms']} ms, "
+            f"p99 {cost['p99_ms']} ms; {result['wall_s']} s wall"
+        )
+        return result
+
+    def bench_scheduler(self, sizes):
+        """Scheduling alone: start n jobs, cancel half, pop the rest in due order (no database)."""
+        self.stdout.write(f"{'pending jobs':>12}{'start us':>12}{'cancel us':>12}{'pop us':>12}")
+        results = {}
+        for n in sizes:
+            clock = [0.0]
+            dispatcher = Dispatcher(clock=lambda: clock[0], background=False)
+            jobs = [
+                SimpleNamespace(id=i, patient_id=0, latitude=0, longitude=0, symptoms="")
+                for i in range(n)
+            ]
+            timings = {}
+            start = time.perf_counter()
+            for job in jobs:
+                clock[0] = self.rng.uniform(0, 3600)
+                dispatcher.start(job)
+            timings["start_us"] = (time.perf_counter() - start) / n * 1e6
+
+            start = time.perf_counter()
+            for job in jobs[::2]:
+                dispatcher.cancel(job.id)
+            timings["cancel_us"] = (time.perf_counter() - start) / (n // 2 or 1) * 1e6
+
+            start = time.perf_counter()
+            popped = 0
+            while dispatcher._pop_due(float("inf")) is not None:
+                popped += 1
+            timings["pop_us"] = (time.perf_counter() - start) / (popped or 1) * 1e6
+
+            results[n] = {key: round(value, 2) for key, value in timings.items()}
+            self.stdout.write(f"{n:>12}" + "".join(f"{results[n][key]:>12}" for key in ("start_us", "cancel_us", "pop_us")))
+        return results
@@ -0,0 +1,64 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db.models import Prefetch
+from rest_framework.renderers import JSONRenderer
+
+from api import feed
+from api.benchmark import scratch_database
+from api.models import DoctorProfile, Offer, Request
+from api.renderers import ORJSONRenderer
+from api.serializers import RequestSerializer
+from api.views import RequestListCreateView
+
+User = get_user_model()
+
+OFFERS_PER_REQUEST = 10
+
+
+class Command(BaseCommand):
+    help = "Compare the DRF serializer path and the api.feed fast path for the requests feed."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000], help="Total offers per run.")
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            patient = User.objects.create(username="bench-patient")
+            doctors = User.objects.bulk_create(User(username=f"bench-doctor-{i}") for i in range(OFFERS_PER_REQUEST))
+            DoctorProfile.objects.bulk_create(
+                DoctorProfile(user=d, full_name=f"Doctor {i}", phone_number="1", region="R") for i, d in enumerate(doctors)
+            )
+
+            self.stdout.write(f"{'offers':>8} {'serializer ms':>14} {'fast path ms':>13} {'speedup':>8}")
+            for size in options["sizes"]:
+                Request.objects.all().delete()
+                requests = Request.objects.bulk_create(
+                    Request(patient=patient, symptoms="bench", latitude=0, longitude=0)
+                    for _ in range(max(1, size // OFFERS_PER_REQUEST))
+                )
+                Offer.objects.bulk_create(
+                    Offer(request=r, doctor=d, price=100, eta_minutes=5) for r in requests for d in doctors
+                )
+                queryset = RequestListCreateView().get_queryset().order_by("created_at", "id")
+                # The serializer baseline gets everything it needs up front (3 queries).
+                prefetched = queryset.select_related("patient").prefetch_related(
+                    Prefetch("offers", queryset=Offer.objects.select_related("doctor__doctor_profile").order_by("id"))
+                )
+
+                slow = self._time(options["repeat"], lambda: JSONRenderer().render(
+                    RequestSerializer(prefetched.all(), many=True).data))
+                fast = self._time(options["repeat"], lambda: ORJSONRenderer().render(
+                    feed.serialize_requests(feed.request_rows(queryset.all()))))
+                self.stdout.write(f"{size:>8} {slow * 1000:>14.1f} {fast * 1000:>13.1f} {slow / fast:>7.1f}x")
+
+    @staticmethod
+    def _time(repeat, func):
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - start)
+        return best
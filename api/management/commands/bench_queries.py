@@ -0,0 +1,141 @@
+import json
+import random
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from api import feed
+from api.benchmark import percentiles, scratch_database
+from api.datagen import CITIES, DataGenerator
+from api.models import DoctorProfile, Offer, Request
+from api.views import find_nearby
+from subscriptions.billing import BillingEngine
+from subscriptions.models import Subscription
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the ORM queries behind each view in api/views.py and subscriptions/views.py "
+        "on generated data of increasing size (a scratch database; real data is never touched)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000],
+                            help="Total requests per step; data is topped up between steps.")
+        parser.add_argument("--repeat", type=int, default=50, help="Samples per query per size.")
+        parser.add_argument("--doctors", type=int, default=2000)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Write the results as JSON to this file.")
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options["seed"])
+        results = {}
+        with scratch_database():
+            generator = DataGenerator(seed=options["seed"])
+            generator.doctors(options["doctors"])
+            generated = 0
+            for size in sorted(options["sizes"]):
+                # Patients and subscribers grow with the request volume.
+                generator.patients((size - generated) // 5)
+                generator.subscribers((size - generated) // 2)
+                generator.requests(size - generated)
+                generated = size
+
+                self.stdout.write(f"\n{size} requests, {Offer.objects.count()} offers, "
+                                  f"{Subscription.objects.count()} subscriptions")
+                self.stdout.write(f"{'query':<34}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+                results[size] = {}
+                for name, query in self.queries().items():
+                    stats = self.time(query, options["repeat"])
+                    results[size][name] = stats
+                    self.stdout.write(f"{name:<34}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}")
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def time(self, query, repeat):
+        samples = []
+        for _ in range(repeat):
+            args = query["args"]()
+            start = time.perf_counter()
+            query["run"](*args)
+            samples.append(time.perf_counter() - start)
+        return percentiles(samples)
+
+    def queries(self):
+        """Each entry draws fresh parameters ("args", untimed) and runs one view's queries ("run")."""
+        rng = self.rng
+        open_ids = list(Request.objects.filter(status="open").values_list("id", flat=True))
+        pending = list(Offer.objects.filter(status="pending").values_list("id", flat=True)[:10000])
+        user_ids = list(Subscription.objects.values_list("user_id", flat=True)[:10000])
+        phones = list(Subscription.objects.exclude(phone_number="").values_list("phone_number", flat=True)[:10000])
+        latest_version = max(Request.objects.order_by("-version").values_list("version", flat=True)[:1] or [0])
+        page_size = settings.REQUESTS_PAGE_SIZE
+
+        def point():
+            _, lat, lng, spread, _ = rng.choice(CITIES)
+            return {"lat": rng.gauss(lat, spread), "lng": rng.gauss(lng, spread)}
+
+        def feed_page(after):
+            rows = feed.request_rows(Request.objects.filter(status="open", created_at__gt=after))
+            return feed.serialize_requests(rows.order_by("created_at", "id")[:page_size])
+
+        def nearby_doctors(params):
+            matches = find_nearby(DoctorProfile.objects.all(), params)
+            return DoctorProfile.objects.in_bulk([pk for pk, _ in matches])
+
+        def changes(since):
+            return (
+                list(Request.objects.filter(version__gt=since).select_related("patient").order_by("version")[:201]),
+                list(Offer.objects.filter(version__gt=since).select_related("doctor__doctor_profile")
+                     .order_by("version")[:201]),
+            )
+
+        def accept(offer_id):
+            # Same statements as OfferAcceptView, rolled back so every sample sees the same data.
+            with transaction.atomic():
+                offer = Offer.objects.select_related("request", "doctor__doctor_profile").filter(
+                    id=offer_id, status="pending").first()
+                if offer is not None:
+                    Request.objects.filter(id=offer.request_id, status="open").update(status="closed")
+                    Offer.objects.filter(id=offer.id, status="pending").update(status="accepted")
+                    Offer.objects.filter(request_id=offer.request_id, status="pending").update(status="rejected")
+                transaction.set_rollback(True)
+
+        def ussd_session(phone):
+            user, _ = User.objects.get_or_create(username=f"user_{phone}")
+            return Subscription.objects.get_or_create(user=user, defaults={"phone_number": phone})
+
+        epoch = timezone.now() - timezone.timedelta(days=365)
+        billing = BillingEngine(client=None)
+        return {
+            "requests feed (first page)": {"args": lambda: (epoch,), "run": feed_page},
+            "requests feed (later page)": {
+                "args": lambda: (timezone.now() - timezone.timedelta(hours=rng.uniform(0, 24)),), "run": feed_page},
+            "requests nearby (10 km)": {
+                "args": lambda: ({**point(), "radius_km": 10},),
+                "run": lambda params: find_nearby(Request.objects.all(), params, scope={"status": "open"})},
+            "doctors nearby (k=10)": {"args": lambda: ({**point(), "k": 10},), "run": nearby_doctors},
+            "request changes (recent)": {
+                "args": lambda: (latest_version - rng.randint(0, 10 ** 8),), "run": changes},
+            "offer create (request lookup)": {
+                "args": lambda: (rng.choice(open_ids) if open_ids else 0,),
+                "run": lambda request_id: Request.objects.filter(id=request_id, status="open").first()},
+            "offer accept": {"args": lambda: (rng.choice(pending) if pending else 0,), "run": accept},
+            "subscription status": {
+                "args": lambda: (rng.choice(user_ids),),
+                "run": lambda user_id: Subscription.objects.filter(user_id=user_id).first()},
+            "ussd session start": {"args": lambda: (rng.choice(phones),), "run": ussd_session},
+            "expire_subscriptions (lapsed)": {"args": tuple, "run": lambda: Subscription.objects.lapsed().count()},
+            "run_billing (due chunk)": {
+                "args": lambda: (timezone.now() + timezone.timedelta(days=1),),
+                "run": lambda cutoff: list(billing.due(None, cutoff)[:billing.chunk_size])},
+        }
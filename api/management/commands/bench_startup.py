@@ -0,0 +1,61 @@
+import json
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.benchmark import percentiles
+
+# Runs in a fresh interpreter: each phase is what a newly forked/spawned worker pays.
+CHILD = r"""
+import json, os, sys, time
+t0 = time.perf_counter()
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "doctor_project.settings")
+from doctor_project.wsgi import application
+t1 = time.perf_counter()
+
+from io import BytesIO
+from wsgiref.util import setup_testing_defaults
+environ = {"PATH_INFO": "/api/health/", "REQUEST_METHOD": "GET", "wsgi.input": BytesIO()}
+setup_testing_defaults(environ)
+body = b"".join(application(environ, lambda status, headers: None))
+t2 = time.perf_counter()
+firebase_loaded = "firebase_admin" in sys.modules
+
+from api import firebase
+firebase.warm_up()
+t3 = time.perf_counter()
+print(json.dumps({
+    "load_app": t1 - t0, "first_response": t2 - t1, "firebase_warm_up": t3 - t2,
+    "firebase_loaded_before_first_verify": firebase_loaded,
+}))
+"""
+
+
+class Command(BaseCommand):
+    help = "Measure worker startup: app import/setup, time to first response, and the deferred Firebase SDK cost."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=10, help="Fresh interpreters to start.")
+
+    def handle(self, *args, **options):
+        samples = {"load_app": [], "first_response": [], "firebase_warm_up": []}
+        eager = False
+        for _ in range(options["repeat"]):
+            out = subprocess.run(
+                [sys.executable, "-c", CHILD], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+            ).stdout
+            result = json.loads(out.strip().splitlines()[-1])
+            eager |= result.pop("firebase_loaded_before_first_verify")
+            for phase, seconds in result.items():
+                samples[phase].append(seconds)
+
+        self.stdout.write(f"{'phase':<20}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+        for phase, values in samples.items():
+            stats = percentiles(values)
+            self.stdout.write(f"{phase:<20}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['max_ms']:>10}")
+        self.stdout.write(
+            "firebase_admin was imported before the first token verification." if eager
+            else "firebase_admin stayed unloaded until warm_up()/first verification."
+        )
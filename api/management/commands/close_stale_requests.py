@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from api.models import Request
+
+
+class Command(BaseCommand):
+    help = (
+        "Close every open request older than REQUEST_TTL_HOURS and reject its pending offers "
+        "(run from cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hours", type=float, help="Override REQUEST_TTL_HOURS for this run.")
+
+    def handle(self, *args, **options):
+        closed, rejected = Request.objects.close_stale(options["hours"])
+        self.stdout.write(f"Closed {closed} stale request(s) and rejected {rejected} pending offer(s).")
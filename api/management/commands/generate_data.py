@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from api.datagen import DataGenerator
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-generate realistic doctors, patients, requests/offers and AfyaPlus subscribers "
+        "into the configured database, for reproducing production scale locally."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=100000)
+        parser.add_argument("--offers-per-request", type=int, default=3, help="Average offers per request.")
+        parser.add_argument("--doctors", type=int, default=2000)
+        parser.add_argument("--patients", type=int, default=20000)
+        parser.add_argument("--subscribers", type=int, default=50000)
+        parser.add_argument("--days", type=int, default=90, help="How far back request history goes.")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--noinput", "--no-input", action="store_false", dest="interactive",
+                            help="Don't ask for confirmation.")
+
+    def handle(self, *args, **options):
+        database = connection.settings_dict["NAME"]
+        if options["interactive"]:
+            answer = input(f"This adds generated rows to {database}. Type 'yes' to continue: ")
+            if answer != "yes":
+                raise CommandError("Cancelled.")
+
+        started = time.perf_counter()
+        generator = DataGenerator(
+            seed=options["seed"], batch_size=options["batch_size"], history_days=options["days"],
+            log=lambda message: self.stdout.write(f"[{time.perf_counter() - started:7.1f}s] {message}"),
+        )
+        generator.doctors(options["doctors"])
+        generator.patients(options["patients"])
+        generator.subscribers(options["subscribers"])
+        generator.requests(options["requests"], options["offers_per_request"])
+        self.stdout.write(self.style.SUCCESS(f"Done in {time.perf_counter() - started:.1f}s."))
@@ -0,0 +1,126 @@
+import json
+import logging
+import subprocess
+import threading
+from datetime import datetime, timezone
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.test.utils import override_settings
+
+from api import notifications
+from api.benchmark import scratch_database
+from api.loadtest import WEIGHTS, LoadTest
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive the real HTTP endpoints concurrently with stub Firebase auth and report "
+        "p50/p95/p99 latency and requests/sec per endpoint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--duration", type=float, default=30, help="Seconds of load after seeding.")
+        parser.add_argument("--concurrency", type=int, default=16, help="Concurrent client threads.")
+        parser.add_argument("--patients", type=int, default=50)
+        parser.add_argument("--doctors", type=int, default=20)
+        parser.add_argument("--seed-requests", type=int, default=100, help="Open requests created before timing.")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed for the operation mix.")
+        parser.add_argument(
+            "--url",
+            help="Load an already running staging server (started with LOADTEST_TARGET=True "
+                 "FIREBASE_TOKEN_VERIFIER=api.loadtest.verify_stub_token) instead of booting one "
+                 "on a scratch database.",
+        )
+        parser.add_argument("--output", help="Write the results as JSON to this file.")
+        parser.add_argument("--compare", help="Earlier --output file to compare against.")
+
+    def handle(self, *args, **options):
+        # 404/409 responses are part of the mix; don't log each one.
+        logging.getLogger("django.request").setLevel(logging.ERROR)
+
+        if options["url"]:
+            endpoints, total = self.drive(options["url"], options)
+        else:
+            endpoints, total = self.drive_in_process(options)
+
+        result = {
+            "commit": self.git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "target": options["url"] or "in-process",
+            "duration_s": options["duration"],
+            "concurrency": options["concurrency"],
+            "mix": WEIGHTS,
+            "endpoints": endpoints,
+            "total": total,
+        }
+        self.report(result)
+
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                self.compare(json.load(f), result)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(result, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def drive(self, url, options):
+        test = LoadTest(
+            url, patients=options["patients"], doctors=options["doctors"],
+            seed_requests=options["seed_requests"], seed=options["seed"],
+        )
+        self.stdout.write(f"Seeding {len(test.doctors)} doctors and {test.seed_requests} requests on {url}...")
+        test.seed()
+        self.stdout.write(f"Running for {options['duration']:g}s with {options['concurrency']} clients...")
+        return test.run(options["duration"], options["concurrency"])
+
+    def drive_in_process(self, options):
+        # Don't let FCM calls skew the numbers.
+        notifications._notifier = notifications.Notifier(notifications.FakeTransport(), workers=0)
+
+        with scratch_database(), override_settings(FIREBASE_TOKEN_VERIFIER="api.loadtest.verify_stub_token"):
+            server = ThreadedWSGIServer(("127.0.0.1", 0), QuietRequestHandler, allow_reuse_address=False)
+            server.set_app(WSGIHandler())
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            try:
+                host, port = server.server_address
+                return self.drive(f"http://{host}:{port}", options)
+            finally:
+                server.shutdown()
+                server.server_close()
+
+    def report(self, result):
+        self.stdout.write(f"\n{'endpoint':<22}{'count':>8}{'errors':>8}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        rows = [*result["endpoints"].items(), ("TOTAL", result["total"])]
+        for name, stats in rows:
+            if not stats["count"]:
+                continue
+            self.stdout.write(
+                f"{name:<22}{stats['count']:>8}{stats['errors']:>8}{stats['rps']:>9}"
+                f"{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}"
+            )
+
+    def compare(self, baseline, result):
+        self.stdout.write(f"\nvs {baseline.get('commit') or 'baseline'} ({baseline.get('timestamp')}):")
+        for name, stats in result["endpoints"].items():
+            before = baseline.get("endpoints", {}).get(name)
+            if not before or not before.get("count") or not stats["count"]:
+                continue
+            p95 = (stats["p95_ms"] - before["p95_ms"]) / before["p95_ms"] * 100 if before["p95_ms"] else 0
+            rps = (stats["rps"] - before["rps"]) / before["rps"] * 100 if before["rps"] else 0
+            self.stdout.write(f"{name:<22}p95 {p95:+7.1f}%   rps {rps:+7.1f}%")
+
+    def git_commit(self):
+        try:
+            return subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
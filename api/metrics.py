@@ -0,0 +1,311 @@
+# api/metrics.py
+"""
+Per-request timings and Prometheus-format histograms.
+
+PerformanceMiddleware opens a Timings record for each request; code along the
+way adds to it with `timed("auth")` etc. When the response leaves, the
+middleware adds a Server-Timing header and folds the numbers into this
+process's histograms, which GET /api/metrics/ renders.
+
+With settings.METRICS_DIR set, every process also snapshots its histograms to
+METRICS_DIR/metrics-<pid>.json and /api/metrics/ sums all snapshots, so the
+numbers cover every gunicorn worker, not just the one answering the scrape.
+When a worker exits, the gunicorn master folds its snapshot into
+metrics-archive.json (archive_process), so counters never go backwards and
+the directory doesn't grow with every recycled worker.
+
+The endpoint is only served to scrapers that send settings.METRICS_TOKEN as a
+bearer token.
+"""
+import atexit
+import contextvars
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+from django.db.backends.signals import connection_created
+from rest_framework import permissions
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds; the last bucket (+Inf) is implicit.
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# name -> (help text, buckets)
+HISTOGRAMS = {
+    "http_request_duration_seconds": ("Total time spent handling the request.", DURATION_BUCKETS),
+    "http_request_db_seconds": ("Time spent executing database queries.", DURATION_BUCKETS),
+    "http_request_db_queries": ("Number of database queries per request.", COUNT_BUCKETS),
+    "http_request_auth_seconds": ("Time spent verifying Firebase ID tokens.", DURATION_BUCKETS),
+    "http_request_serialize_seconds": ("Time spent rendering the response body.", DURATION_BUCKETS),
+}
+
+_current = contextvars.ContextVar("request_timings", default=None)
+
+
+class Timings:
+    def __init__(self):
+        self.phases = defaultdict(float)
+        self.queries = 0
+
+
+@contextmanager
+def timed(phase):
+    """Add the block's wall time to `phase` of the current request (no-op outside a request)."""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.phases[phase] += time.perf_counter() - start
+
+
+class Registry:
+    """Histograms keyed by (metric name, label tuple): [bucket counts..., +Inf count, sum]."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+        self._last_flush = 0.0
+
+    def observe(self, name, labels, value):
+        buckets = HISTOGRAMS[name][1]
+        key = (name, labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(buckets) + 2)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return [[name, list(labels), list(series)] for (name, labels), series in self._series.items()]
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    # --- multi-process support -------------------------------------------------
+
+    def flush(self, force=False):
+        # Nothing to write for processes that never served a request (e.g. the gunicorn master).
+        if not self._series or not settings.configured:
+            return
+        directory = getattr(settings, "METRICS_DIR", None)
+        if not directory:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_flush < getattr(settings, "METRICS_FLUSH_SECONDS", 5):
+            return
+        self._last_flush = now
+        path = os.path.join(directory, f"metrics-{os.getpid()}.json")
+        tmp = f"{path}.tmp"
+        # Called from the response path: a bad METRICS_DIR must never fail a request.
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with open(tmp, "w") as fh:
+                json.dump(self.snapshot(), fh)
+            os.replace(tmp, path)
+        except OSError:
+            logger.warning("Could not write metrics snapshot to %s", path, exc_info=True)
+
+    def collect(self):
+        """Merge this process's live series with every other process's last snapshot."""
+        directory = getattr(settings, "METRICS_DIR", None)
+        snapshots = [self.snapshot()]
+        if directory and os.path.isdir(directory):
+            own = f"metrics-{os.getpid()}.json"
+            for filename in os.listdir(directory):
+                if filename.startswith("metrics-") and filename.endswith(".json") and filename != own:
+                    try:
+                        with open(os.path.join(directory, filename)) as fh:
+                            snapshots.append(json.load(fh))
+                    except (OSError, ValueError):
+                        continue
+
+        return _merge(snapshots)
+
+
+def _merge(snapshots):
+    merged = {}
+    for snapshot in snapshots:
+        for name, labels, series in snapshot:
+            key = (name, tuple(labels))
+            if key in merged:
+                merged[key] = [a + b for a, b in zip(merged[key], series)]
+            else:
+                merged[key] = list(series)
+    return merged
+
+
+def archive_process(directory, pid):
+    """
+    Fold an exited process's snapshot into metrics-archive.json and remove it.
+    Run by the gunicorn master (child_exit), one worker at a time.
+    """
+    path = os.path.join(directory, f"metrics-{pid}.json")
+    archive = os.path.join(directory, "metrics-archive.json")
+    if not os.path.exists(path):
+        return
+    snapshots = []
+    for filename in (archive, path):
+        try:
+            with open(filename) as fh:
+                snapshots.append(json.load(fh))
+        except FileNotFoundError:
+            continue
+        except (OSError, ValueError):
+            logger.warning("Could not read metrics snapshot %s", filename, exc_info=True)
+            return
+    merged = [[name, list(labels), series] for (name, labels), series in _merge(snapshots).items()]
+    tmp = f"{archive}.tmp"
+    try:
+        with open(tmp, "w") as fh:
+            json.dump(merged, fh)
+        os.replace(tmp, archive)
+        os.remove(path)
+    except OSError:
+        logger.warning("Could not archive metrics snapshot %s", path, exc_info=True)
+
+
+class HasMetricsToken(permissions.BasePermission):
+    """Allow requests carrying `Authorization: Bearer <settings.METRICS_TOKEN>`; nobody if unset."""
+
+    def has_permission(self, request, view):
+        expected = getattr(settings, "METRICS_TOKEN", None)
+        parts = request.headers.get("Authorization", "").split()
+        if not expected or len(parts) != 2 or parts[0].lower() != "bearer":
+            return False
+        return hmac.compare_digest(parts[1].encode(), expected.encode())
+
+
+registry = Registry()
+
+# Recycled workers (gunicorn max_requests) would otherwise drop up to
+# METRICS_FLUSH_SECONDS of observations.
+atexit.register(registry.flush, force=True)
+
+
+def _format_labels(pairs):
+    escaped = ('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+def render_prometheus(extra_counters=None):
+    """Render all histograms (plus optional {name: (help, value)} counters) in text format 0.0.4."""
+    merged = registry.collect()
+    lines = []
+    for name, (help_text, buckets) in HISTOGRAMS.items():
+        series = sorted((labels, values) for (n, labels), values in merged.items() if n == name)
+        if not series:
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for labels, values in series:
+            pairs = [("endpoint", labels[0]), ("method", labels[1])]
+            for bound, count in zip(buckets, values):
+                lines.append(f"{name}_bucket{_format_labels(pairs + [('le', bound)])} {count}")
+            lines.append(f"{name}_bucket{_format_labels(pairs + [('le', '+Inf')])} {values[-2]}")
+            lines.append(f"{name}_count{_format_labels(pairs)} {values[-2]}")
+            lines.append(f"{name}_sum{_format_labels(pairs)} {values[-1]}")
+    for name, (help_text, value) in (extra_counters or {}).items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def _count_query(execute, sql, params, many, context):
+    timings = _current.get()
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        if timings is not None:
+            timings.queries += 1
+            timings.phases["db"] += time.perf_counter() - start
+
+
+def _install_query_counter(connection, **kwargs):
+    # Inserted first so `with connection.execute_wrapper(...)` blocks can still pop their own wrapper.
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _count_query)
+
+
+# Every connection, in every thread (including sync_to_async workers under ASGI), counts queries.
+connection_created.connect(_install_query_counter)
+
+
+class PerformanceMiddleware:
+    """Measure every request: DB queries/time, auth, rendering and total latency."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        # The connection may predate this module (e.g. opened by a management command).
+        _install_query_counter(connection)
+        timings = Timings()
+        token = _current.set(timings)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, timings, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        timings = Timings()
+        token = _current.set(timings)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, timings, time.perf_counter() - start)
+
+    def _finish(self, request, response, timings, total):
+        # Long-lived streams (e.g. /api/events/) would only distort the histograms.
+        if response.streaming:
+            return response
+
+        phases = timings.phases
+        response["Server-Timing"] = ", ".join([
+            f'db;dur={phases["db"] * 1000:.2f};desc="{timings.queries} queries"',
+            f"auth;dur={phases['auth'] * 1000:.2f}",
+            f"serialize;dur={phases['serialize'] * 1000:.2f}",
+            f"total;dur={total * 1000:.2f}",
+        ])
+
+        match = getattr(request, "resolver_match", None)
+        labels = (match.route if match else "unmatched", request.method)
+        registry.observe("http_request_duration_seconds", labels, total)
+        registry.observe("http_request_db_seconds", labels, phases["db"])
+        registry.observe("http_request_db_queries", labels, timings.queries)
+        registry.observe("http_request_auth_seconds", labels, phases["auth"])
+        registry.observe("http_request_serialize_seconds", labels, phases["serialize"])
+        registry.flush()
+        return response
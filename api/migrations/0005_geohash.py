@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-18 19:35
+
+from django.db import migrations, models
+
+from api import geo
+
+
+def backfill_geohash(apps, schema_editor):
+    for model_name in ('DoctorProfile', 'Request'):
+        model = apps.get_model('api', model_name)
+        rows = list(model.objects.only('id', 'latitude', 'longitude'))
+        for row in rows:
+            row.geohash = geo.encode(float(row.latitude), float(row.longitude))
+        model.objects.bulk_update(rows, ['geohash'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_doctorprofile_latitude_doctorprofile_longitude'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctorprofile',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12),
+        ),
+        migrations.AddField(
+            model_name='request',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12),
+        ),
+        migrations.RunPython(backfill_geohash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 20:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='request',
+            name='dispatch',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,27 @@
+import time
+
+from django.db import migrations
+
+
+def backfill_versions(apps, schema_editor):
+    # Rows created before 0006 were left at version 0, which the delta-sync scan
+    # (version > since, since >= 0) never returns. Give them distinct versions that
+    # end just below the current clock, in id order, so they sync like fresh changes.
+    for model_name in ('Request', 'Offer'):
+        model = apps.get_model('api', model_name)
+        rows = list(model.objects.filter(version=0).only('id').order_by('id'))
+        base = time.time_ns() // 1000 - len(rows)
+        for i, row in enumerate(rows):
+            row.version = base + i
+        model.objects.bulk_update(rows, ['version'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_archive'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_versions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.8 on 2026-10-18 20:32
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_backfill_versions'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='offer',
+            name='offer_pending_request_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='request',
+            name='request_open_feed_idx',
+        ),
+    ]
@@ -1,5 +1,95 @@
-from django.db import models
+import threading
+import time
+from datetime import timedelta
+
+from django.db import models, transaction
 from django.conf import settings
+from django.utils import timezone
+
+from . import events, geo
+
+_version_lock = threading.Lock()
+_last_version = 0
+
+
+def next_version():
+    """
+    Return a change version for Request/Offer rows: microseconds since the epoch,
+    bumped so it is strictly increasing within this process. Clients sync with
+    GET /api/requests/changes/?since=<version>.
+    """
+    global _last_version
+    with _version_lock:
+        _last_version = max(_last_version + 1, time.time_ns() // 1000)
+        return _last_version
+
+
+def version_watermark():
+    """
+    Return the highest version delta sync may hand out right now.
+
+    Versions are taken before the write commits, and from each process's own
+    clock, so a row can become visible after rows with higher versions. Rows
+    newer than CHANGES_SAFETY_LAG_SECONDS are held back until every write that
+    could still land below them has committed; a cursor never passes this mark.
+    """
+    return time.time_ns() // 1000 - int(settings.CHANGES_SAFETY_LAG_SECONDS * 1_000_000)
+
+
+class VersionedQuerySet(models.QuerySet):
+    # Bulk updates (e.g. rejecting every pending offer) must bump versions too,
+    # otherwise delta-sync clients would never see those rows change.
+    def update(self, **kwargs):
+        kwargs.setdefault('version', next_version())
+        kwargs.setdefault('updated_at', timezone.now())
+        return super().update(**kwargs)
+
+
+class RequestQuerySet(VersionedQuerySet):
+    def stale(self, ttl_hours=None, now=None):
+        """Open requests older than REQUEST_TTL_HOURS (served by request_status_created_idx)."""
+        ttl_hours = settings.REQUEST_TTL_HOURS if ttl_hours is None else ttl_hours
+        return self.filter(status='open', created_at__lt=(now or timezone.now()) - timedelta(hours=ttl_hours))
+
+    def close_stale(self, ttl_hours=None, now=None):
+        """
+        Close every stale request and reject its pending offers, in one
+        transaction. Returns (requests, offers).
+
+        Like accepting an offer, closing publishes request.closed and stops
+        any dispatch still running for the request (once committed).
+        """
+        from . import dispatch
+
+        stale = self.stale(ttl_hours, now or timezone.now())
+        with transaction.atomic():
+            # Locked, so an offer can't be accepted between closing and publishing.
+            ids = list(stale.select_for_update().values_list('id', flat=True))
+            if not ids:
+                return 0, 0
+            rejected = Offer.objects.filter(status='pending', request_id__in=ids).update(status='rejected')
+            closed = self.filter(id__in=ids, status='open').update(status='closed', dispatch_due_at=None)
+            for request_id in ids:
+                events.publish(events.REQUESTS_CHANNEL, 'request.closed', {"id": request_id})
+                dispatch.cancel(request_id)
+        return closed, rejected
+
+
+class VersionedModel(models.Model):
+    updated_at = models.DateTimeField(auto_now=True)
+    version = models.BigIntegerField(default=0, db_index=True, editable=False)
+
+    objects = VersionedQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        self.version = next_version()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'version', 'updated_at'}
+        super().save(*args, **kwargs)
 
 # This model stores the doctor-specific information.
 # It's linked one-to-one with the main User model.
@@ -11,12 +101,18 @@ class DoctorProfile(models.Model):
     # --- ADDED THESE TWO LINES ---
     latitude = models.FloatField(default=0.0)
     longitude = models.FloatField(default=0.0)
+    # Derived from latitude/longitude on save; indexed for "nearby" lookups (see api/geo.py)
+    geohash = models.CharField(max_length=12, blank=True, db_index=True, editable=False)
+
+    def save(self, *args, **kwargs):
+        self.geohash = geo.encode(float(self.latitude), float(self.longitude))
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Dr. {self.full_name}"
 
 # This model stores the patient's request for help.
-class Request(models.Model):
+class Request(VersionedModel):
     STATUS_CHOICES = [('open', 'Open'), ('closed', 'Closed')]
 
     patient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='requests')
@@ -25,12 +121,34 @@ class Request(models.Model):
     longitude = models.DecimalField(max_digits=9, decimal_places=6)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='open')
     created_at = models.DateTimeField(auto_now_add=True)
+    # Emergency mode: nearby doctors are notified directly, in widening waves (see api/dispatch.py)
+    dispatch = models.BooleanField(default=False)
+    # When the next dispatch wave is due; null once dispatch has ended (see api/dispatch.py)
+    dispatch_due_at = models.DateTimeField(null=True, blank=True, db_index=True, editable=False)
+    # Derived from latitude/longitude on save; indexed with status for "nearby" lookups (see api/geo.py)
+    geohash = models.CharField(max_length=12, blank=True, editable=False)
+
+    objects = RequestQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='request_status_created_idx'),
+            # Nearby lookups only look at open requests; a plain geohash index would lose to the one above.
+            models.Index(fields=['status', 'geohash'], name='request_status_geohash_idx'),
+            # archive_requests walks closed requests oldest-closed first (see api/archive.py). No
+            # partial indexes here: the planner prefers the status-led composites over them.
+            models.Index(fields=['status', 'updated_at'], name='request_status_updated_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.geohash = geo.encode(float(self.latitude), float(self.longitude))
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Request by {self.patient.username} ({self.status})"
 
 # This model stores a doctor's bid/offer on a specific request.
-class Offer(models.Model):
+class Offer(VersionedModel):
     STATUS_CHOICES = [('pending', 'Pending'), ('accepted', 'Accepted'), ('rejected', 'Rejected')]
 
     request = models.ForeignKey(Request, related_name='offers', on_delete=models.CASCADE)
@@ -41,5 +159,52 @@ class Offer(models.Model):
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Also serves rejecting a request's other pending offers on accept.
+            models.Index(fields=['request', 'status'], name='offer_request_status_idx'),
+        ]
+
     def __str__(self):
         return f"Offer by {self.doctor.username} for {self.price} on Request #{self.request.id}"
+
+
+# Closed requests and their offers, moved out of Request/Offer by
+# `manage.py archive_requests` (see api/archive.py). Rows keep their original ids.
+class ArchivedRequest(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    patient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='archived_requests')
+    symptoms = models.TextField()
+    latitude = models.DecimalField(max_digits=9, decimal_places=6)
+    longitude = models.DecimalField(max_digits=9, decimal_places=6)
+    status = models.CharField(max_length=10, choices=Request.STATUS_CHOICES)
+    dispatch = models.BooleanField(default=False)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    version = models.BigIntegerField(default=0)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Request history: a patient's requests, newest first.
+            models.Index(fields=['patient', 'id'], name='archived_request_patient_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived request #{self.id}"
+
+
+class ArchivedOffer(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    request = models.ForeignKey(ArchivedRequest, related_name='offers', on_delete=models.CASCADE)
+    doctor = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='archived_offers')
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    eta_minutes = models.IntegerField()
+    message = models.TextField(blank=True, null=True)
+    status = models.CharField(max_length=10, choices=Offer.STATUS_CHOICES)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"Archived offer #{self.id}"
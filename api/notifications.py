@@ -0,0 +1,156 @@
+# api/notifications.py
+"""
+Push notifications to devices registered through SaveFcmTokenView.
+
+Views call notify() inside their transaction; once it commits, the job is
+handed to a small worker pool so the HTTP response never waits on FCM.
+Each worker looks up the audience's tokens, sends them in multicast batches
+and bulk-clears the tokens the provider reports as dead.
+
+The transport is pluggable (settings.NOTIFICATIONS["TRANSPORT"]); tests and
+local development can use FakeTransport.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from subscriptions.models import Subscription
+
+from . import firebase
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "TRANSPORT": "api.notifications.FCMTransport",
+    "WORKERS": 4,
+    "BATCH_SIZE": 500,  # FCM's multicast limit
+}
+
+
+class FCMTransport:
+    """Send through Firebase Cloud Messaging using the default firebase_admin app."""
+
+    def send_multicast(self, tokens, title, body, data):
+        from firebase_admin import exceptions as firebase_exceptions, messaging
+
+        firebase.initialize()
+
+        message = messaging.MulticastMessage(
+            tokens=tokens,
+            notification=messaging.Notification(title=title, body=body),
+            # FCM data payloads only accept string values
+            data={key: str(value) for key, value in data.items()},
+        )
+        response = messaging.send_each_for_multicast(message)
+
+        dead = (messaging.UnregisteredError, messaging.SenderIdMismatchError, firebase_exceptions.InvalidArgumentError)
+        return [
+            token for token, result in zip(tokens, response.responses)
+            if not result.success and isinstance(result.exception, dead)
+        ]
+
+
+class FakeTransport:
+    """Record messages instead of sending them. Tokens in `invalid_tokens` are reported as dead."""
+
+    def __init__(self, invalid_tokens=()):
+        self.invalid_tokens = set(invalid_tokens)
+        self.sent = []
+
+    def send_multicast(self, tokens, title, body, data):
+        self.sent.append({"tokens": list(tokens), "title": title, "body": body, "data": data})
+        return [token for token in tokens if token in self.invalid_tokens]
+
+
+class Notifier:
+    def __init__(self, transport, workers=4, batch_size=500):
+        self.transport = transport
+        self.batch_size = batch_size
+        # workers=0 delivers inline, which is what tests want.
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="notify") if workers else None
+
+    def submit(self, audience, title, body, data):
+        if self._executor is None:
+            self._deliver(audience, title, body, data)
+        else:
+            self._executor.submit(self._run, self._deliver, audience, title, body, data)
+
+    def _run(self, func, *args):
+        try:
+            func(*args)
+        except Exception:
+            logger.exception("Notification delivery failed")
+        finally:
+            # Worker threads keep their own DB connections; don't leak them between jobs.
+            connections.close_all()
+
+    def _deliver(self, audience, title, body, data):
+        tokens = (
+            Subscription.objects.filter(audience)
+            .filter(fcm_token__isnull=False)
+            .exclude(fcm_token="")
+            .values_list("fcm_token", flat=True)
+            .iterator()
+        )
+        batch = []
+        for token in tokens:
+            batch.append(token)
+            if len(batch) == self.batch_size:
+                self._send_batch(batch, title, body, data)
+                batch = []
+        if batch:
+            self._send_batch(batch, title, body, data)
+
+    def _send_batch(self, tokens, title, body, data):
+        if self._executor is not None and len(tokens) == self.batch_size:
+            # Full batches mean a large audience: send them in parallel.
+            self._executor.submit(self._run, self._send, tokens, title, body, data)
+        else:
+            self._send(tokens, title, body, data)
+
+    def _send(self, tokens, title, body, data):
+        invalid = self.transport.send_multicast(tokens, title, body, data)
+        if invalid:
+            # Clear rather than delete: the row also carries the user's AfyaPlus subscription.
+            cleared = Subscription.objects.filter(fcm_token__in=invalid).update(fcm_token=None)
+            logger.info("Removed %s dead FCM tokens", cleared)
+
+
+_notifier = None
+_notifier_lock = threading.Lock()
+
+
+def get_notifier():
+    global _notifier
+    if _notifier is None:
+        with _notifier_lock:
+            if _notifier is None:
+                config = {**DEFAULTS, **getattr(settings, "NOTIFICATIONS", {})}
+                _notifier = Notifier(
+                    import_string(config["TRANSPORT"])(),
+                    workers=config["WORKERS"],
+                    batch_size=config["BATCH_SIZE"],
+                )
+    return _notifier
+
+
+def notify(audience, title, body, data):
+    """Queue a notification to every device matching `audience` (a Q on Subscription) after commit."""
+    transaction.on_commit(lambda: get_notifier().submit(audience, title, body, data))
+
+
+def doctors():
+    return Q(user__doctor_profile__isnull=False)
+
+
+def user(user_id):
+    return Q(user_id=user_id)
+
+
+def users(user_ids):
+    return Q(user_id__in=user_ids)
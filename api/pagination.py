@@ -0,0 +1,27 @@
+# api/pagination.py
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class OpenRequestCursorPagination(CursorPagination):
+    """
+    Keyset pagination for the open-requests feed.
+
+    Pages are ordered by (created_at, id) and addressed with an opaque cursor,
+    so fetching page N costs the same as fetching page 1 (no OFFSET scans).
+    Clients follow the 'next' link and may ask for ?page_size=<n>.
+
+    Pagination is opt-in: the feed used to be a plain JSON array, and clients
+    that send neither ?cursor= nor ?page_size= still get one (every open
+    request). Paginated clients get {"next", "previous", "results"}.
+    """
+    ordering = ('created_at', 'id')
+    page_size = getattr(settings, "REQUESTS_PAGE_SIZE", 50)
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, "REQUESTS_MAX_PAGE_SIZE", 200)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.cursor_query_param not in params and self.page_size_query_param not in params:
+            return None
+        return super().paginate_queryset(queryset, request, view)
@@ -0,0 +1,45 @@
+# api/renderers.py
+from rest_framework.renderers import JSONRenderer
+
+from .metrics import timed
+
+try:
+    import orjson
+except ImportError:  # optional speedup; fall back to the stdlib encoder
+    orjson = None
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """DRF's JSONRenderer, with its time reported as the request's 'serialize' phase."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with timed("serialize"):
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class ORJSONRenderer(TimedJSONRenderer):
+    """
+    Render with orjson when it is installed, producing the same bytes as DRF's
+    compact, non-ASCII-escaping JSONRenderer. Types orjson would format
+    differently (datetimes, Decimals, lazy strings...) are handed to DRF's
+    encoder; pretty-printed (?indent=) output still goes through DRF.
+    """
+    _options = (
+        orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if orjson else 0
+    )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or data is None
+            or self.ensure_ascii
+            or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        with timed("serialize"):
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=self._options)
+            # Same strict-javascript-subset escaping as JSONRenderer
+            return ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Request, Offer, DoctorProfile
+from .models import ArchivedRequest, Request, Offer, DoctorProfile
 
 class DoctorProfileSerializer(serializers.ModelSerializer):
     class Meta:
@@ -25,9 +25,66 @@ class RequestSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Request
-        fields = ['id', 'patient_name', 'symptoms', 'status', 'created_at', 'offers', 'latitude', 'longitude']
+        fields = ['id', 'patient_name', 'symptoms', 'status', 'created_at', 'offers', 'latitude', 'longitude', 'dispatch']
         # The app will send latitude and longitude, but they are not part of the main list view
         extra_kwargs = {
             'latitude': {'write_only': True},
             'longitude': {'write_only': True},
+            'dispatch': {'write_only': True},
         }
+
+class RequestChangeSerializer(serializers.ModelSerializer):
+    # Flat request row for delta sync; offers are synced separately
+    patient_name = serializers.CharField(source='patient.username', read_only=True)
+
+    class Meta:
+        model = Request
+        fields = ['id', 'patient_name', 'symptoms', 'status', 'created_at', 'updated_at', 'version']
+
+class OfferChangeSerializer(OfferSerializer):
+    request_id = serializers.IntegerField(read_only=True)
+
+    class Meta(OfferSerializer.Meta):
+        fields = OfferSerializer.Meta.fields + ['request_id', 'updated_at', 'version']
+
+class HistoryOfferSerializer(serializers.ModelSerializer):
+    doctor_name = serializers.CharField(source='doctor.doctor_profile.full_name', read_only=True, default=None)
+    doctor_id = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Offer
+        fields = ['id', 'doctor_id', 'doctor_name', 'price', 'eta_minutes', 'message', 'status', 'created_at']
+
+class HistoryRequestSerializer(serializers.ModelSerializer):
+    # One entry of a patient's request history, live or archived
+    offers = HistoryOfferSerializer(many=True, read_only=True)
+    archived = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Request
+        fields = ['id', 'symptoms', 'status', 'created_at', 'updated_at', 'latitude', 'longitude', 'offers', 'archived']
+
+    def get_archived(self, obj):
+        return isinstance(obj, ArchivedRequest)
+
+class HistoryQuerySerializer(serializers.Serializer):
+    # Validates ?before=&limit= for the request history (before: a request id from the previous page's cursor)
+    before = serializers.IntegerField(min_value=1, required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=20)
+
+class NearbyQuerySerializer(serializers.Serializer):
+    # Validates ?lat=&lng=&radius_km=&k= for the "nearby" lookups
+    lat = serializers.FloatField(min_value=-90, max_value=90)
+    lng = serializers.FloatField(min_value=-180, max_value=180)
+    radius_km = serializers.FloatField(min_value=0, required=False)
+    k = serializers.IntegerField(min_value=1, required=False)
+
+class LocationPingSerializer(serializers.Serializer):
+    # Validates a doctor's live position ping
+    latitude = serializers.FloatField(min_value=-90, max_value=90)
+    longitude = serializers.FloatField(min_value=-180, max_value=180)
+
+class ChangesQuerySerializer(serializers.Serializer):
+    # Validates ?since=&limit= for the delta-sync endpoint
+    since = serializers.IntegerField(min_value=0, default=0)
+    limit = serializers.IntegerField(min_value=1, max_value=1000, default=200)
@@ -0,0 +1,78 @@
+# api/streams.py
+"""
+Server-Sent Events endpoint that replaces polling of GET /api/requests/.
+
+Served through doctor_project/asgi.py. Clients authenticate with the same
+Firebase ID token as the REST API, either in the Authorization header or as
+?token= (browsers' EventSource cannot set headers).
+"""
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework import exceptions
+from rest_framework.utils.encoders import JSONEncoder
+
+from . import events
+from .authentication import authenticate_token
+from .models import DoctorProfile
+
+
+def _get_token(request):
+    auth_header = request.headers.get("Authorization", "")
+    parts = auth_header.split()
+    if len(parts) == 2 and parts[0].lower() == "bearer":
+        return parts[1]
+    return request.GET.get("token")
+
+
+async def _event_source(channels):
+    broker = events.get_broker()
+    subscriber = broker.subscribe(channels)
+    keepalive = getattr(settings, "EVENT_STREAM_KEEPALIVE_SECONDS", 15)
+    try:
+        # Tell EventSource how quickly to reconnect; also flushes headers to the client.
+        yield "retry: 3000\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(subscriber.queue.get(), timeout=keepalive)
+            except asyncio.TimeoutError:
+                # Comment line keeps proxies from closing an idle connection.
+                yield ": keepalive\n\n"
+                continue
+            yield f"event: {event['type']}\ndata: {json.dumps(event['data'], cls=JSONEncoder)}\n\n"
+    finally:
+        broker.unsubscribe(subscriber)
+
+
+async def event_stream(request):
+    """
+    Doctors receive request.created / request.closed for the whole feed;
+    every user receives offer.created / offer.accepted for their own requests.
+    """
+    if not isinstance(request, ASGIRequest):
+        # Under WSGI, Django drains an async stream to the end before sending any of
+        # it: the client would never see an event and the worker thread would hang.
+        return JsonResponse(
+            {"detail": "The event stream needs the ASGI server (GUNICORN_WORKER_CLASS=uvicorn)."}, status=501
+        )
+    token = _get_token(request)
+    if not token:
+        return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+    try:
+        user = await sync_to_async(authenticate_token)(token)
+    except exceptions.APIException as e:
+        return JsonResponse({"detail": str(e.detail)}, status=e.status_code)
+
+    channels = [events.patient_channel(user.id)]
+    if await DoctorProfile.objects.filter(user=user).aexists():
+        channels.append(events.REQUESTS_CHANNEL)
+
+    response = StreamingHttpResponse(_event_source(channels), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # Stop nginx from buffering the stream
+    response["X-Accel-Buffering"] = "no"
+    return response
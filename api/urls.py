@@ -1,19 +1,27 @@
 # api/urls.py
 
 from django.urls import path, include
-from . import views
+from . import streams, views
 
 # --- IMPORT THE NEW VIEW FROM THE SUBSCRIPTIONS APP ---
 from subscriptions.views import SaveFcmTokenView
 
 urlpatterns = [
     path('health/', views.HealthCheckView.as_view(), name='health-check'),
+    path('metrics/', views.MetricsView.as_view(), name='metrics'),
     
     # Existing app paths
     path('doctors/register/', views.DoctorRegistrationView.as_view(), name='doctor-register'),
+    path('doctors/location/', views.DoctorLocationView.as_view(), name='doctor-location'),
+    path('doctors/nearby/', views.NearbyDoctorsView.as_view(), name='doctor-nearby'),
     path('requests/', views.RequestListCreateView.as_view(), name='request-list-create'),
+    path('requests/changes/', views.RequestChangesView.as_view(), name='request-changes'),
+    path('requests/history/', views.RequestHistoryView.as_view(), name='request-history'),
     path('requests/<int:request_id>/offers/', views.OfferCreateView.as_view(), name='offer-create'),
     path('offers/<int:offer_id>/accept/', views.OfferAcceptView.as_view(), name='offer-accept'),
+
+    # Server-Sent Events stream of new requests/offers (served via ASGI)
+    path('events/', streams.event_stream, name='event-stream'),
     
     # --- ADD THE CORRECT FCM TOKEN URL HERE ---
     # This now correctly handles calls to /api/save-fcm-token/
@@ -1,9 +1,40 @@
+from django.conf import settings
 from django.db import transaction
+from django.db.models import Prefetch
+from django.http import HttpResponse
 from rest_framework import generics, permissions, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from .models import Request, Offer, DoctorProfile
-from .serializers import RequestSerializer, DoctorProfileSerializer
+from . import dispatch, events, feed, geo, locations, metrics, notifications
+from .authentication import token_cache, user_cache
+from .models import ArchivedOffer, ArchivedRequest, Request, Offer, DoctorProfile, version_watermark
+from .pagination import OpenRequestCursorPagination
+from .serializers import (
+    RequestSerializer, OfferSerializer, DoctorProfileSerializer, NearbyQuerySerializer,
+    RequestChangeSerializer, OfferChangeSerializer, ChangesQuerySerializer, LocationPingSerializer,
+    HistoryRequestSerializer, HistoryQuerySerializer,
+)
+
+
+def find_nearby(queryset, params, buffer=None, scope=None):
+    """
+    Resolve validated NearbyQuerySerializer params to [(pk, distance_km), ...], nearest first.
+    - radius_km (optionally with k): everything within the radius, at most k rows
+    - k alone: the k nearest rows, searching out to NEARBY_MAX_RADIUS_KM
+    `scope` lookups are pushed into each geohash range (see geo.cells_filter).
+    Pass a LocationBuffer to fold in positions that haven't been flushed yet.
+    """
+    lat, lng = params['lat'], params['lng']
+    limit = min(params.get('k', settings.NEARBY_MAX_RESULTS), settings.NEARBY_MAX_RESULTS)
+    if 'radius_km' not in params and 'k' in params:
+        radius_km = settings.NEARBY_MAX_RADIUS_KM
+        matches = geo.nearest(queryset, lat, lng, limit, radius_km, scope=scope)
+    else:
+        radius_km = min(params.get('radius_km', settings.NEARBY_DEFAULT_RADIUS_KM), settings.NEARBY_MAX_RADIUS_KM)
+        matches = geo.nearby(queryset, lat, lng, radius_km, limit, scope=scope)
+    if buffer is not None:
+        matches = buffer.overlay(matches, lat, lng, radius_km, limit)
+    return matches
 
 # Handles Doctor Registration
 class DoctorRegistrationView(APIView):
@@ -22,18 +53,145 @@ class DoctorRegistrationView(APIView):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+# Handles POST of a doctor's live position; buffered and written in bulk (see api/locations.py)
+class DoctorLocationView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        serializer = LocationPingSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        profile_id = locations.profile_id_for(request.user.id)
+        if profile_id is None:
+            return Response({"error": "Register as a doctor first."}, status=status.HTTP_404_NOT_FOUND)
+        locations.buffer.record(profile_id, serializer.validated_data['latitude'], serializer.validated_data['longitude'])
+        return Response(status=status.HTTP_202_ACCEPTED)
+
 # Handles GET for all open requests (for Doctors) and POST to create a request (for Patients)
 class RequestListCreateView(generics.ListCreateAPIView):
     serializer_class = RequestSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = OpenRequestCursorPagination
 
     def get_queryset(self):
-        # Only return requests that are currently 'open'
+        # Only return requests that are currently 'open'.
         return Request.objects.filter(status='open')
 
+    def list(self, request, *args, **kwargs):
+        # Listing goes through api.feed, which builds the same payload as
+        # RequestSerializer straight from .values() rows (2 queries per page).
+        open_requests = self.filter_queryset(self.get_queryset())
+
+        # ?lat=&lng= switches the feed to "nearby" mode: nearest first, with distances, unpaginated.
+        if 'lat' not in request.query_params and 'lng' not in request.query_params:
+            page = self.paginate_queryset(feed.request_rows(open_requests))
+            if page is None:
+                # Legacy clients (no ?cursor= / ?page_size=) get a plain array of every open request.
+                return Response(feed.serialize_requests(feed.request_rows(open_requests.order_by('created_at', 'id'))))
+            return self.get_paginated_response(feed.serialize_requests(page))
+
+        params = NearbyQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        matches = find_nearby(Request.objects.all(), params.validated_data, scope={'status': 'open'})
+
+        rows = {row['id']: row for row in feed.request_rows(open_requests.filter(pk__in=[pk for pk, _ in matches]))}
+        ordered = [(rows[pk], distance) for pk, distance in matches if pk in rows]
+        results = feed.serialize_requests(row for row, _ in ordered)
+        for item, (_, distance) in zip(results, ordered):
+            item['distance_km'] = round(distance, 3)
+        # Same envelope as a paginated page; nearby results always fit in one.
+        return Response({"next": None, "previous": None, "results": results})
+
     def perform_create(self, serializer):
         # When a patient POSTs, automatically assign them as the patient
         serializer.save(patient=self.request.user)
+        if serializer.instance.dispatch:
+            # Emergency: the nearest doctors are notified in waves instead of everyone at once
+            dispatch.dispatch(serializer.instance)
+            return
+        # Push the new request to every connected doctor's feed and phone
+        dispatch.broadcast(serializer.instance, serializer.data)
+
+# Handles GET for requests/offers created or changed since a version cursor (delta sync)
+class RequestChangesView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        params = ChangesQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        since, limit = params.validated_data['since'], params.validated_data['limit']
+
+        # Both scans walk the version index from the cursor, so cost is O(changes).
+        # Rows above the watermark may still have lower-versioned writes in flight.
+        watermark = version_watermark()
+        requests_qs = Request.objects.filter(version__lte=watermark).select_related('patient')
+        offers_qs = Offer.objects.filter(version__lte=watermark).select_related('doctor__doctor_profile', 'request')
+        requests = list(requests_qs.filter(version__gt=since).order_by('version')[:limit + 1])
+        offers = list(offers_qs.filter(version__gt=since).order_by('version')[:limit + 1])
+
+        # Merge both streams by version and cut at `limit` so the cursor never skips a row.
+        changes = sorted(requests + offers, key=lambda row: row.version)
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+        cursor = changes[-1].version if changes else since
+        if has_more:
+            # Bulk updates give many rows one version: finish that version on this
+            # page, since the next one starts strictly after the cursor.
+            seen = {(type(row), row.pk) for row in changes}
+            changes += [
+                row for row in [*requests_qs.filter(version=cursor), *offers_qs.filter(version=cursor)]
+                if (type(row), row.pk) not in seen
+            ]
+
+        # Only hand out what the list endpoints would show this user: open requests and
+        # their offers, plus their own requests and offers. Other requests that closed
+        # are reported by id alone, so clients can drop them from the feed.
+        user_id = request.user.id
+        changed_requests = [c for c in changes if isinstance(c, Request)]
+        others_closed = [r for r in changed_requests if r.status != 'open' and r.patient_id != user_id]
+        offered_on = set(
+            Offer.objects.filter(doctor_id=user_id, request_id__in=[r.id for r in others_closed])
+            .values_list('request_id', flat=True)
+        ) if others_closed else set()
+        hidden = {r.id for r in others_closed if r.id not in offered_on}
+        offers = [
+            c for c in changes if isinstance(c, Offer)
+            and (c.doctor_id == user_id or c.request.patient_id == user_id or c.request.status == 'open')
+        ]
+
+        return Response({
+            "requests": RequestChangeSerializer([r for r in changed_requests if r.id not in hidden], many=True).data,
+            "offers": OfferChangeSerializer(offers, many=True).data,
+            "closed_request_ids": sorted(hidden),
+            "cursor": str(cursor),
+            "has_more": has_more,
+        })
+
+# Handles GET for the logged-in patient's past requests, newest first, live and archived alike
+class RequestHistoryView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        params = HistoryQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        before, limit = params.validated_data.get('before'), params.validated_data['limit']
+
+        # Archived rows keep their ids, so both tables page on the same id order.
+        # Each side reads at most limit + 1 rows, then the two are merged.
+        def page(model, offer_model):
+            queryset = model.objects.filter(patient=request.user)
+            if before is not None:
+                queryset = queryset.filter(id__lt=before)
+            offers = offer_model.objects.select_related('doctor__doctor_profile').order_by('id')
+            return list(queryset.prefetch_related(Prefetch('offers', queryset=offers)).order_by('-id')[:limit + 1])
+
+        rows = sorted(page(Request, Offer) + page(ArchivedRequest, ArchivedOffer), key=lambda row: row.id, reverse=True)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        return Response({
+            "results": HistoryRequestSerializer(rows, many=True).data,
+            "cursor": rows[-1].id if has_more else None,
+            "has_more": has_more,
+        })
 
 # Handles POST for a doctor to create an offer on a specific request
 class OfferCreateView(APIView):
@@ -46,14 +204,28 @@ class OfferCreateView(APIView):
             return Response({"error": "Request not found or is already closed."}, status=status.HTTP_404_NOT_FOUND)
 
         # Create the offer for the logged-in doctor
-        Offer.objects.create(
+        offer = Offer.objects.create(
             request=target_request,
             doctor=request.user,
             price=request.data.get('price'),
             eta_minutes=request.data.get('eta_minutes'),
             message=request.data.get('message', '')
         )
-        return Response({"message": "Offer submitted successfully."}, status=status.HTTP_201_CREATED)
+        # No more dispatch waves once someone has offered
+        dispatch.cancel(target_request.id)
+        # Let the waiting patient see the offer without polling
+        events.publish(
+            events.patient_channel(target_request.patient_id),
+            'offer.created',
+            {"request_id": target_request.id, **OfferSerializer(offer).data},
+        )
+        notifications.notify(
+            notifications.user(target_request.patient_id),
+            "New offer",
+            f"A doctor offered to help for {offer.price}, ETA {offer.eta_minutes} min.",
+            {"type": "offer.created", "request_id": target_request.id, "offer_id": offer.id},
+        )
+        return Response({"message": "Offer submitted successfully.", "offer_id": offer.id}, status=status.HTTP_201_CREATED)
 
 # Handles POST for a patient to accept an offer, which closes the loop
 class OfferAcceptView(APIView):
@@ -61,25 +233,46 @@ class OfferAcceptView(APIView):
 
     def post(self, request, offer_id):
         try:
-            offer_to_accept = Offer.objects.get(id=offer_id, status='pending')
+            # One query for the offer, its request and the doctor's profile
+            offer_to_accept = Offer.objects.select_related('request', 'doctor__doctor_profile').get(
+                id=offer_id, status='pending'
+            )
         except Offer.DoesNotExist:
             return Response({"error": "Offer not found or already handled."}, status=status.HTTP_404_NOT_FOUND)
 
         parent_request = offer_to_accept.request
         # Security Check: Ensure the user accepting is the patient who made the request
-        if parent_request.patient != request.user:
+        if parent_request.patient_id != request.user.id:
             return Response({"error": "You do not have permission to accept this offer."}, status=status.HTTP_403_FORBIDDEN)
 
-        # Use a transaction to ensure all database changes succeed or fail together
+        # Use a transaction to ensure all database changes succeed or fail together.
+        # The UPDATEs are guarded by the expected current status, so when two accepts
+        # race (or a client retries) exactly one of them matches a row; the rest see
+        # a rowcount of 0 and back out without touching anything.
         with transaction.atomic():
-            parent_request.status = 'closed'
-            parent_request.save()
-
-            offer_to_accept.status = 'accepted'
-            offer_to_accept.save()
+            closed = Request.objects.filter(id=parent_request.id, status='open').update(status='closed')
+            accepted = closed and Offer.objects.filter(id=offer_to_accept.id, status='pending').update(status='accepted')
+            if not accepted:
+                transaction.set_rollback(True)
+                return Response({"error": "Offer not found or already handled."}, status=status.HTTP_409_CONFLICT)
 
             # Reject all other pending offers for this request
-            parent_request.offers.filter(status='pending').update(status='rejected')
+            Offer.objects.filter(request_id=parent_request.id, status='pending').update(status='rejected')
+
+            parent_request.status = 'closed'
+            offer_to_accept.status = 'accepted'
+            events.publish(
+                events.patient_channel(parent_request.patient_id),
+                'offer.accepted',
+                {"request_id": parent_request.id, **OfferSerializer(offer_to_accept).data},
+            )
+            events.publish(events.REQUESTS_CHANNEL, 'request.closed', {"id": parent_request.id})
+            notifications.notify(
+                notifications.user(offer_to_accept.doctor_id),
+                "Offer accepted",
+                "Your offer was accepted. Please head to the patient.",
+                {"type": "offer.accepted", "request_id": parent_request.id, "offer_id": offer_to_accept.id},
+            )
 
         # --- THIS IS THE KEY FIX ---
         # 1. Get the profile of the doctor who made the accepted offer
@@ -99,8 +292,48 @@ class OfferAcceptView(APIView):
             }
         }, status=status.HTTP_200_OK)
 
+# Handles GET for the doctors nearest to a point (?lat=&lng=&radius_km=&k=)
+class NearbyDoctorsView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        params = NearbyQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        validated = params.validated_data
+        validated.setdefault('k', 10)
+        matches = find_nearby(DoctorProfile.objects.all(), validated, buffer=locations.buffer)
+
+        profiles = DoctorProfile.objects.in_bulk([pk for pk, _ in matches])
+        positions = locations.buffer.positions()
+        results = []
+        for pk, distance in matches:
+            if pk in profiles:
+                profile = profiles[pk]
+                if pk in positions:
+                    profile.latitude, profile.longitude = positions[pk]
+                item = DoctorProfileSerializer(profile).data
+                item['distance_km'] = round(distance, 3)
+                results.append(item)
+        return Response({"results": results})
+
 class HealthCheckView(APIView):
     permission_classes = [permissions.AllowAny] # This makes it public
 
     def get(self, request, *args, **kwargs):
         return Response({"status": "ok"}, status=status.HTTP_200_OK)
+
+# Prometheus scrape target: per-endpoint latency/DB/auth/render histograms for all workers
+class MetricsView(APIView):
+    permission_classes = [metrics.HasMetricsToken]
+    authentication_classes = []
+
+    def get(self, request, *args, **kwargs):
+        body = metrics.render_prometheus({
+            "firebase_token_cache_hits_total": ("Verified-token cache hits in this process.", token_cache.hits),
+            "firebase_token_cache_misses_total": ("Verified-token cache misses in this process.", token_cache.misses),
+            "user_cache_hits_total": ("uid -> user cache hits in this process.", user_cache.hits),
+            "user_cache_misses_total": ("uid -> user cache misses in this process.", user_cache.misses),
+            "location_pings_total": ("Doctor location pings received by this process.", locations.buffer.pings),
+            "location_rows_written_total": ("Doctor locations written by buffer flushes.", locations.buffer.rows_written),
+        })
+        return HttpResponse(body, content_type="text/plain; version=0.0.4; charset=utf-8")
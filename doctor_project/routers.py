@@ -0,0 +1,144 @@
+# doctor_project/routers.py
+"""
+Send safe reads to read replicas and everything else to the primary.
+
+Replicas are every database alias other than "default" (see DATABASE_REPLICAS
+in settings.py). Reads go to a random replica unless the current request is
+pinned to the primary:
+
+- the request is a write (any method but GET/HEAD/OPTIONS), so reads that
+  follow its writes see them;
+- the request has written anything (a GET that creates a row, say), from
+  that point on;
+- the query runs inside a transaction on the primary;
+- the client wrote within the last REPLICA_PIN_SECONDS, so a patient who has
+  just posted a request or accepted an offer reads their own write even if
+  the replicas lag behind. The mobile apps don't keep cookies, so clients
+  are recognised by their user: after a write, ReplicaPinningMiddleware
+  records the user in the REPLICA_PIN_CACHE cache (shared by every process
+  when CACHES points at e.g. Redis or Memcached), and authentication pins
+  their later requests through `identify()`. Browsers also get a
+  short-lived cookie, which pins the request before it is authenticated.
+
+Code outside a request (cron jobs and other management commands, background
+threads) always reads from the primary: billing, archiving and closing stale
+requests act on what they read, and must not act on a lagging copy.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = "db_primary"
+PIN_CACHE_KEY = "db_primary:{}"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class _Pin:
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+        self.user_id = None
+
+
+# A mutable holder, so writes made in a sync_to_async thread still pin the request.
+_current = ContextVar("db_pin", default=None)
+
+
+def identify(user_id):
+    """
+    Tell the current request who its user is (called on authentication):
+    a user who wrote within REPLICA_PIN_SECONDS reads from the primary.
+    """
+    pin = _current.get()
+    if pin is None:
+        return
+    pin.user_id = user_id
+    if not pin.pinned and _pin_cache().get(PIN_CACHE_KEY.format(user_id)):
+        pin.pinned = True
+
+
+def _pin_cache():
+    return caches[settings.REPLICA_PIN_CACHE]
+
+
+@contextmanager
+def pin_to_primary():
+    """Route every read in the block to the primary."""
+    token = _current.set(_Pin(pinned=True))
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+class PrimaryReplicaRouter:
+    def __init__(self, replicas=None):
+        if replicas is None:
+            replicas = [alias for alias in settings.DATABASES if alias != DEFAULT_DB_ALIAS]
+        self.replicas = list(replicas)
+
+    def db_for_read(self, model, **hints):
+        pin = _current.get()
+        if not self.replicas or pin is None or pin.pinned or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(self.replicas)
+
+    def db_for_write(self, model, **hints):
+        pin = _current.get()
+        if pin is not None:
+            pin.pinned = pin.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaPinningMiddleware:
+    """Pin write requests (and the client's next REPLICA_PIN_SECONDS) to the primary."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        pin = self._start(request)
+        token = _current.set(pin)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(pin, response)
+
+    async def __acall__(self, request):
+        pin = self._start(request)
+        token = _current.set(pin)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(pin, response)
+
+    def _start(self, request):
+        return _Pin(pinned=request.method not in SAFE_METHODS or PIN_COOKIE in request.COOKIES)
+
+    def _finish(self, pin, response):
+        if pin.wrote:
+            if pin.user_id is not None:
+                _pin_cache().set(PIN_CACHE_KEY.format(pin.user_id), 1, timeout=settings.REPLICA_PIN_SECONDS)
+            response.set_cookie(PIN_COOKIE, "1", max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite="Lax")
+        return response
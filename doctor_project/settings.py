@@ -2,6 +2,8 @@
 import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 SECRET_KEY = os.environ.get("DJANGO_SECRET_KEY", "change-this-secret-in-prod")
@@ -28,6 +30,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its timings cover everything below it
+    "api.metrics.PerformanceMiddleware",
+    # Before anything that reads the database (see doctor_project/routers.py)
+    "doctor_project.routers.ReplicaPinningMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -51,14 +57,44 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "doctor_project.wsgi.application"
-# ASGI_APPLICATION is not used by default, but leaving it is fine.
-# ASGI_APPLICATION = "doctor_project.asgi.application" 
+# The live event stream (/api/events/) needs an ASGI server, e.g.
+# uvicorn doctor_project.asgi:application
+ASGI_APPLICATION = "doctor_project.asgi.application"
 
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        "ENGINE": os.environ.get("DATABASE_ENGINE", "django.db.backends.sqlite3"),
+        "NAME": os.environ.get("DATABASE_NAME") or BASE_DIR / "db.sqlite3",
+        # Keep connections open between requests (one per worker thread); the health
+        # check replaces a connection the server dropped instead of failing the request.
+        "CONN_MAX_AGE": int(os.environ.get("DATABASE_CONN_MAX_AGE", "60")),
+        "CONN_HEALTH_CHECKS": os.environ.get("DATABASE_CONN_HEALTH_CHECKS", "True") == "True",
+        # A file (not in-memory) test database lets concurrency tests use real threads.
+        "TEST": {"NAME": BASE_DIR / "test_db.sqlite3"},
+    }
+}
+if DATABASES["default"]["ENGINE"].endswith("sqlite3"):
+    # Take the write lock at BEGIN: a transaction that reads first and then writes
+    # would otherwise fail on a concurrent commit instead of waiting (busy_timeout).
+    DATABASES["default"]["OPTIONS"] = {
+        "transaction_mode": os.environ.get("SQLITE_TRANSACTION_MODE", "IMMEDIATE"),
     }
+else:
+    DATABASES["default"].update({
+        "USER": os.environ.get("DATABASE_USER", ""),
+        "PASSWORD": os.environ.get("DATABASE_PASSWORD", ""),
+        "HOST": os.environ.get("DATABASE_HOST", ""),
+        "PORT": os.environ.get("DATABASE_PORT", ""),
+    })
+    DATABASES["default"].pop("TEST")
+
+# Applied to every new SQLite connection (api/db.py).
+SQLITE_PRAGMAS = {
+    "journal_mode": os.environ.get("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "mmap_size": int(os.environ.get("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "cache_size": -int(os.environ.get("SQLITE_CACHE_SIZE_KB", str(64 * 1024))),
 }
 
 AUTH_PASSWORD_VALIDATORS = []
@@ -83,6 +119,10 @@ REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": (
         "rest_framework.permissions.IsAuthenticated",
     ),
+    "DEFAULT_RENDERER_CLASSES": (
+        "api.renderers.ORJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
 }
 
 # Firebase Admin initialization: expects firebase_key.json in project root
@@ -103,3 +143,129 @@ AFYA_PLUS_ACTIVATION_FEE = 1000.0
 AFYA_PLUS_WEEKLY_FEE = 350.0
 AFYA_PLUS_GRACE_PERIOD_DAYS = 3 # The number of failed attempts before pausing
 # ---------------------------------------------------------------------
+
+# Max number of verified Firebase ID tokens kept in memory per process.
+# Each entry expires at the token's own 'exp' claim.
+FIREBASE_TOKEN_CACHE_SIZE = int(os.environ.get("FIREBASE_TOKEN_CACHE_SIZE", "10000"))
+
+# Dotted path to a callable replacing firebase_auth.verify_id_token. Only for
+# load testing (`manage.py loadtest`, "api.loadtest.verify_stub_token"); never set in production.
+# The stub lets anyone sign in as any uid, so it is refused unless the server is
+# also explicitly started as a load-test target (LOADTEST_TARGET=True).
+FIREBASE_TOKEN_VERIFIER = os.environ.get("FIREBASE_TOKEN_VERIFIER") or None
+if FIREBASE_TOKEN_VERIFIER and os.environ.get("LOADTEST_TARGET") != "True":
+    raise ImproperlyConfigured("FIREBASE_TOKEN_VERIFIER is only allowed together with LOADTEST_TARGET=True.")
+
+# Per-process cache of Firebase uid -> user, invalidated on user save/delete.
+USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = int(os.environ.get("USER_CACHE_TTL", "300"))
+
+# Page size for the cursor-paginated open-requests feed (GET /api/requests/).
+REQUESTS_PAGE_SIZE = int(os.environ.get("REQUESTS_PAGE_SIZE", "50"))
+REQUESTS_MAX_PAGE_SIZE = int(os.environ.get("REQUESTS_MAX_PAGE_SIZE", "200"))
+
+# Delta sync (/api/requests/changes/) only serves rows whose version is at least this
+# old, so writes still committing (or stamped by a worker whose clock runs behind)
+# can't land below a cursor a client already holds. Keep it above the longest
+# request/offer transaction plus the clock skew between hosts.
+CHANGES_SAFETY_LAG_SECONDS = float(os.environ.get("CHANGES_SAFETY_LAG_SECONDS", "5"))
+
+# "Nearby" lookups (?lat=&lng=&radius_km=&k=) on the requests feed and doctors.
+NEARBY_DEFAULT_RADIUS_KM = float(os.environ.get("NEARBY_DEFAULT_RADIUS_KM", "10"))
+NEARBY_MAX_RADIUS_KM = float(os.environ.get("NEARBY_MAX_RADIUS_KM", "500"))
+NEARBY_MAX_RESULTS = int(os.environ.get("NEARBY_MAX_RESULTS", "200"))
+
+# Live event stream (/api/events/). Swap the broker for one backed by Redis etc.
+# when running more than one ASGI process.
+EVENT_BROKER = os.environ.get("EVENT_BROKER", "api.events.InProcessBroker")
+EVENT_STREAM_KEEPALIVE_SECONDS = int(os.environ.get("EVENT_STREAM_KEEPALIVE_SECONDS", "15"))
+
+# Push notifications (api/notifications.py). Use "api.notifications.FakeTransport"
+# to log instead of sending; WORKERS=0 delivers inline on commit.
+NOTIFICATIONS = {
+    "TRANSPORT": os.environ.get("NOTIFICATIONS_TRANSPORT", "api.notifications.FCMTransport"),
+    "WORKERS": int(os.environ.get("NOTIFICATIONS_WORKERS", "4")),
+    "BATCH_SIZE": int(os.environ.get("NOTIFICATIONS_BATCH_SIZE", "500")),
+}
+
+# /api/metrics/: set METRICS_DIR to a directory shared by all gunicorn workers so the
+# scrape aggregates every process (each writes a snapshot at most every METRICS_FLUSH_SECONDS).
+METRICS_DIR = os.environ.get("METRICS_DIR") or None
+METRICS_FLUSH_SECONDS = float(os.environ.get("METRICS_FLUSH_SECONDS", "5"))
+# Bearer token the Prometheus scraper must send to /api/metrics/; unset, nobody can read it.
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN") or None
+
+# USSD sessions (subscriptions/ussd.py): gateways drop sessions after a few minutes.
+USSD_SESSION_CACHE_SIZE = int(os.environ.get("USSD_SESSION_CACHE_SIZE", "10000"))
+USSD_SESSION_TTL = int(os.environ.get("USSD_SESSION_TTL", "180"))
+
+# GET /api/subscriptions/status/ answers from a short per-user cache; run
+# `manage.py expire_subscriptions` from cron to expire lapsed subscriptions in bulk.
+SUBSCRIPTION_STATUS_CACHE_SIZE = int(os.environ.get("SUBSCRIPTION_STATUS_CACHE_SIZE", "10000"))
+SUBSCRIPTION_STATUS_CACHE_TTL = int(os.environ.get("SUBSCRIPTION_STATUS_CACHE_TTL", "30"))
+
+# Nightly renewal run (`manage.py run_billing`, see subscriptions/billing.py).
+BILLING = {
+    "PAYMENT_CLIENT": os.environ.get("BILLING_PAYMENT_CLIENT", "subscriptions.billing.AfricasTalkingClient"),
+    "WORKERS": int(os.environ.get("BILLING_WORKERS", "16")),
+    "CHUNK_SIZE": int(os.environ.get("BILLING_CHUNK_SIZE", "500")),
+    # Renew subscriptions whose cover ends within this many hours of the run date.
+    "LOOKAHEAD_HOURS": int(os.environ.get("BILLING_LOOKAHEAD_HOURS", "24")),
+    # Lease a run holds on its BillingRun row; an overlapping run waits it out. Keep it
+    # above the time one chunk of charges can take.
+    "LEASE_SECONDS": int(os.environ.get("BILLING_LEASE_SECONDS", "1800")),
+}
+
+# Doctors' live location pings (POST /api/doctors/location/) are coalesced in memory
+# and written with one bulk UPDATE per interval, or sooner once FLUSH_SIZE doctors are pending.
+LOCATION_FLUSH_INTERVAL = float(os.environ.get("LOCATION_FLUSH_INTERVAL", "5"))
+LOCATION_FLUSH_SIZE = int(os.environ.get("LOCATION_FLUSH_SIZE", "500"))
+
+# Auto-dispatch for emergency requests (Request.dispatch, see api/dispatch.py): the
+# WAVE_SIZE nearest doctors are notified, then the next ones every WAVE_TIMEOUT_SECONDS
+# until an offer arrives, widening the search from START_RADIUS_KM to MAX_RADIUS_KM.
+DISPATCH = {
+    "WAVE_SIZE": int(os.environ.get("DISPATCH_WAVE_SIZE", "5")),
+    "WAVE_TIMEOUT_SECONDS": float(os.environ.get("DISPATCH_WAVE_TIMEOUT_SECONDS", "45")),
+    "START_RADIUS_KM": float(os.environ.get("DISPATCH_START_RADIUS_KM", "3")),
+    "MAX_RADIUS_KM": float(os.environ.get("DISPATCH_MAX_RADIUS_KM", "50")),
+    "MAX_WAVES": int(os.environ.get("DISPATCH_MAX_WAVES", "8")),
+}
+
+# `manage.py archive_requests` (api/archive.py): requests closed more than ARCHIVE_AFTER_DAYS
+# ago move to the archive tables, ARCHIVE_BATCH_SIZE requests per transaction.
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", "30"))
+ARCHIVE_BATCH_SIZE = int(os.environ.get("ARCHIVE_BATCH_SIZE", "500"))
+
+# Open requests older than this are closed, with their pending offers rejected, by
+# `manage.py close_stale_requests` (run from cron).
+REQUEST_TTL_HOURS = float(os.environ.get("REQUEST_TTL_HOURS", "24"))
+
+# Read replicas: a comma-separated list of replica hosts (or, for SQLite, database
+# files), each otherwise configured like the primary. Safe reads are spread over
+# them; writes and a client's reads for REPLICA_PIN_SECONDS after a write go to the
+# primary (doctor_project/routers.py), as do all reads outside a request (cron jobs,
+# management commands, background threads). Users who just wrote are remembered in
+# the REPLICA_PIN_CACHE cache, which must be shared by every process: with replicas,
+# a per-process cache is refused at startup.
+for _i, _location in enumerate(filter(None, os.environ.get("DATABASE_REPLICAS", "").split(","))):
+    _key = "NAME" if DATABASES["default"]["ENGINE"].endswith("sqlite3") else "HOST"
+    DATABASES[f"replica{_i + 1}"] = {**DATABASES["default"], _key: _location.strip(), "TEST": {"MIRROR": "default"}}
+DATABASE_ROUTERS = ["doctor_project.routers.PrimaryReplicaRouter"]
+REPLICA_PIN_SECONDS = int(os.environ.get("REPLICA_PIN_SECONDS", "5"))
+REPLICA_PIN_CACHE = os.environ.get("REPLICA_PIN_CACHE", "default")
+
+# e.g. CACHE_BACKEND=django.core.cache.backends.redis.RedisCache CACHE_LOCATION=redis://cache:6379/1
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.environ.get("CACHE_LOCATION", ""),
+    }
+}
+if len(DATABASES) > 1 and CACHES.get(REPLICA_PIN_CACHE, {}).get("BACKEND") in (
+    "django.core.cache.backends.locmem.LocMemCache", "django.core.cache.backends.dummy.DummyCache",
+):
+    raise ImproperlyConfigured(
+        "DATABASE_REPLICAS needs REPLICA_PIN_CACHE to be a cache shared by every process "
+        "(set CACHE_BACKEND and CACHE_LOCATION), or clients may not read their own writes."
+    )
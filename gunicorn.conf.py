@@ -0,0 +1,123 @@
+# gunicorn.conf.py
+"""
+Production server settings. gunicorn reads this file automatically when started
+from the repository root:
+
+    gunicorn                                   # WSGI app, gthread workers
+    GUNICORN_WORKER_CLASS=uvicorn gunicorn     # ASGI app (doctor_project/asgi.py)
+
+Requests spend most of their time waiting (Firebase token verification on a
+cache miss, database round trips), so a handful of processes each running
+several threads (gthread) or an event loop (uvicorn) keeps far more requests
+in flight than the default one-request-per-process sync workers.
+
+- gthread: the default. Every endpoint works except the /api/events/ stream,
+  which answers 501 under WSGI (Django can't send an async stream
+  incrementally there); clients keep polling GET /api/requests/changes/.
+- uvicorn: required for /api/events/ (Server-Sent Events); the regular DRF
+  views run in Django's sync-to-async thread.
+
+Every value can be overridden with the environment variable next to it.
+
+Measured with `manage.py loadtest --url ... --duration 20 --concurrency 32`
+(server started with LOADTEST_TARGET=True FIREBASE_TOKEN_VERIFIER=api.loadtest.verify_stub_token),
+1 vCPU shared with the load generator, SQLite:
+
+    mode                      req/s   p50 ms   p95 ms   p99 ms
+    sync, 3 workers             246      128      152      176
+    gthread, 3 x 4 threads      248       59      340      608
+    gthread, 3 x 8 threads      236       72      492     1410
+    uvicorn, 2 workers          169      182      294      398
+
+On one core throughput is CPU-bound whatever the mode; threads halve the
+median latency, while the tail is writes queueing on SQLite's single writer
+lock (hence 4 threads, not 8). Under ASGI the sync DRF views share one
+thread per worker, which is why uvicorn trails: use it for the event stream,
+not for raw request throughput. Real Firebase verification and a networked
+database add I/O waits the stub doesn't, which widens gthread's lead.
+"""
+import multiprocessing
+import os
+
+cpus = multiprocessing.cpu_count()
+mode = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+
+bind = os.environ.get("GUNICORN_BIND", f"0.0.0.0:{os.environ.get('PORT', '8000')}")
+
+if mode == "uvicorn":
+    wsgi_app = "doctor_project.asgi:application"
+    # uvicorn.workers is deprecated; the gunicorn worker ships as the uvicorn-worker package.
+    worker_class = "uvicorn_worker.UvicornWorker"
+    # One event loop per core; extra processes only add context switches.
+    workers = int(os.environ.get("WEB_CONCURRENCY", cpus + 1))
+elif mode == "gthread":
+    wsgi_app = "doctor_project.wsgi:application"
+    worker_class = "gthread"
+    workers = int(os.environ.get("WEB_CONCURRENCY", cpus * 2 + 1))
+    # Threads wait on I/O most of the time; the GIL caps the CPU-bound part anyway.
+    threads = int(os.environ.get("GUNICORN_THREADS", 4))
+else:
+    raise ValueError(f"GUNICORN_WORKER_CLASS must be 'gthread' or 'uvicorn', not {mode!r}")
+
+# Import Django, the app and the Firebase SDK once in the master; workers fork
+# with them already loaded (shared copy-on-write pages, fast restarts).
+preload_app = os.environ.get("GUNICORN_PRELOAD", "True") == "True"
+
+# Recycle workers periodically to cap slow memory growth; jitter avoids all
+# workers restarting at once.
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 2000))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", 200))
+
+# Seconds to hold idle client connections open. Keep it above the load
+# balancer's idle timeout when there is one, so the proxy never reuses a
+# connection gunicorn has just closed.
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 5))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+
+# Worker heartbeats on tmpfs: a disk-backed /tmp can stall them under I/O pressure.
+if os.path.isdir("/dev/shm"):
+    worker_tmp_dir = "/dev/shm"
+
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG") or None
+loglevel = os.environ.get("GUNICORN_LOG_LEVEL", "info")
+
+
+def on_starting(server):
+    if preload_app:
+        from api import firebase
+
+        firebase.warm_up()
+
+
+def post_fork(server, worker):
+    # Connections opened in the master (by anything that ran while preloading)
+    # must not be shared with the children.
+    from django.db import connections
+
+    connections.close_all()
+
+
+def post_worker_init(worker):
+    # Start sweeping for emergency dispatch jobs lost with a recycled worker
+    # (see api/dispatch.py) as soon as this one is up.
+    from api import dispatch
+
+    dispatch.get_dispatcher().start_background()
+
+
+def worker_exit(server, worker):
+    # Hand this worker's pending dispatch waves to the others.
+    from api import dispatch
+
+    dispatch.get_dispatcher().release()
+
+
+def child_exit(server, worker):
+    # Keep an exited worker's request counts in /api/metrics/ without leaving its
+    # snapshot file behind (see api/metrics.py). Runs in the master.
+    directory = os.environ.get("METRICS_DIR")
+    if directory:
+        from api import metrics
+
+        metrics.archive_process(directory, worker.pid)
@@ -0,0 +1,360 @@
+# subscriptions/billing.py
+"""
+Weekly AfyaPlus renewal engine (run nightly with `manage.py run_billing`).
+
+Subscriptions due for renewal are read in (valid_until, id)-ordered chunks, charged in
+parallel through a bounded thread pool, and each chunk's outcome is written in
+one transaction (guarded per-subscription UPDATEs, BillingAttempt rows, run
+checkpoint). Re-running the same date resumes after the last recorded chunk.
+
+Charging is at most once per run: a pending BillingAttempt (unique per run and
+subscription) is committed for the whole chunk before any charge goes out, and
+subscriptions that already have an attempt in the run are skipped. If a run
+dies mid-chunk, the attempts it left pending are not retried (the gateway may
+have taken the money); they need reconciling by hand, and the subscriptions
+fall due again in the next night's run. Only one process works on a run at a
+time: it holds a lease on the BillingRun row, renewed at every checkpoint.
+
+A mobile checkout the gateway accepted is not yet paid: the subscriber still
+has to approve it on their handset. Its attempt stays pending with the
+gateway's transaction id and the subscription is left alone (and not charged
+again) until the outcome is known, from the gateway's payment notification
+(PaymentNotificationView) or the reconciliation pass at the start of each run.
+
+Policy:
+- success: cover extended by 7 days, failure counter reset
+- awaiting confirmation: nothing changes until the outcome is settled
+- failure: one grace day added; after AFYA_PLUS_GRACE_PERIOD_DAYS consecutive
+  failures the subscription is PAUSED and no longer charged
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DateTimeField, F, Q, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import BillingAttempt, BillingRun, Subscription
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "PAYMENT_CLIENT": "subscriptions.billing.AfricasTalkingClient",
+    "WORKERS": 16,
+    "CHUNK_SIZE": 500,
+    "LOOKAHEAD_HOURS": 24,
+    "LEASE_SECONDS": 1800,
+}
+
+COVER_PERIOD = timedelta(days=7)
+GRACE_STEP = timedelta(days=1)
+
+
+@dataclass
+class ChargeResult:
+    # None: accepted by the gateway, awaiting the subscriber's confirmation
+    success: bool | None
+    reference: str = ""
+    error: str = ""
+
+
+class AfricasTalkingClient:
+    """
+    Charge through Africa's Talking mobile checkout. The pinned africastalking
+    SDK (2.x) no longer ships a Payment service, so this calls the REST API.
+    An accepted checkout (PendingConfirmation) is reported as pending; the
+    subscriber confirms it on their handset and `lookup` reports the outcome.
+    """
+    LIVE_URL = "https://payments.africastalking.com/mobile/checkout/request"
+    SANDBOX_URL = "https://payments.sandbox.africastalking.com/mobile/checkout/request"
+    LIVE_LOOKUP_URL = "https://payments.africastalking.com/query/transaction/find"
+    SANDBOX_LOOKUP_URL = "https://payments.sandbox.africastalking.com/query/transaction/find"
+
+    def __init__(self):
+        import requests
+
+        self.username = settings.AFRICASTALKING_USERNAME
+        sandbox = self.username == "sandbox"
+        self.url = self.SANDBOX_URL if sandbox else self.LIVE_URL
+        self.lookup_url = self.SANDBOX_LOOKUP_URL if sandbox else self.LIVE_LOOKUP_URL
+        # One pooled HTTP session shared by the worker threads
+        self.session = requests.Session()
+        self.session.headers.update({"apiKey": settings.AFRICASTALKING_API_KEY, "Accept": "application/json"})
+
+    def charge(self, phone_number, amount, currency, metadata):
+        try:
+            response = self.session.post(self.url, json={
+                "username": self.username,
+                "productName": settings.AFRICASTALKING_PRODUCT_NAME,
+                "phoneNumber": phone_number,
+                "currencyCode": currency,
+                "amount": float(amount),
+                "metadata": metadata,
+            }, timeout=30)
+            body = response.json()
+        except Exception as e:
+            return ChargeResult(False, error=str(e)[:255])
+
+        return self._result(body, body.get("transactionId", ""))
+
+    def lookup(self, reference):
+        try:
+            response = self.session.get(
+                self.lookup_url, params={"username": self.username, "transactionId": reference}, timeout=30
+            )
+            body = response.json()
+        except Exception as e:
+            return ChargeResult(None, reference=reference, error=str(e)[:255])
+        if body.get("status") != "Success":
+            # The lookup itself failed; the charge is still unresolved.
+            return ChargeResult(None, reference=reference, error=str(body.get("errorMessage") or "")[:255])
+        return self._result(body.get("data") or {}, reference)
+
+    @staticmethod
+    def _result(body, reference):
+        status = body.get("status")
+        if status == "PendingConfirmation":
+            return ChargeResult(None, reference=reference)
+        if status == "Success":
+            return ChargeResult(True, reference=reference)
+        return ChargeResult(False, reference=reference, error=str(body.get("description") or status)[:255])
+
+
+class FakePaymentClient:
+    """
+    Approve every charge except for phone numbers in `failing_numbers` (declined)
+    and `pending_numbers` (awaiting confirmation until `outcomes[reference]` is set).
+    Records calls.
+    """
+
+    def __init__(self, failing_numbers=(), pending_numbers=(), outcomes=None):
+        self.failing_numbers = set(failing_numbers)
+        self.pending_numbers = set(pending_numbers)
+        self.outcomes = outcomes if outcomes is not None else {}
+        self.charges = []
+
+    def charge(self, phone_number, amount, currency, metadata):
+        self.charges.append(phone_number)
+        if phone_number in self.failing_numbers:
+            return ChargeResult(False, error="Insufficient funds")
+        reference = f"fake-{metadata['subscription_id']}"
+        return ChargeResult(None if phone_number in self.pending_numbers else True, reference=reference)
+
+    def lookup(self, reference):
+        return self.outcomes.get(reference, ChargeResult(None, reference=reference))
+
+
+class BillingEngine:
+    def __init__(self, client, workers=16, chunk_size=500, lookahead=timedelta(hours=24), lease=timedelta(minutes=30)):
+        self.client = client
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.lookahead = lookahead
+        # Must outlast charging one chunk, or an overlapping run could take over mid-chunk.
+        self.lease = lease
+        self.amount = Decimal(str(settings.AFYA_PLUS_WEEKLY_FEE))
+        self.currency = settings.AFRICASTALKING_CURRENCY_CODE
+        self.max_failures = settings.AFYA_PLUS_GRACE_PERIOD_DAYS
+
+    @classmethod
+    def from_settings(cls, **overrides):
+        config = {**DEFAULTS, **getattr(settings, "BILLING", {}), **overrides}
+        return cls(
+            import_string(config["PAYMENT_CLIENT"])(),
+            workers=config["WORKERS"],
+            chunk_size=config["CHUNK_SIZE"],
+            lookahead=timedelta(hours=config["LOOKAHEAD_HOURS"]),
+            lease=timedelta(seconds=config["LEASE_SECONDS"]),
+        )
+
+    def due(self, after, cutoff):
+        """
+        Subscriptions due by `cutoff`, in (valid_until, id) order after the `after`
+        checkpoint (a (valid_until, id) pair, or None from the start). The order is
+        the (status, valid_until) index's own, so a chunk is read without sorting.
+        """
+        due = Subscription.objects.filter(status=Subscription.Status.ACTIVE, valid_until__lte=cutoff)
+        if after is not None:
+            valid_until, id = after
+            # The redundant lower bound keeps it a single range scan of the index.
+            due = due.filter(Q(valid_until__gt=valid_until) | Q(valid_until=valid_until, id__gt=id),
+                             valid_until__gte=valid_until)
+        return (
+            due.order_by("valid_until", "id")
+            .only("id", "phone_number", "valid_until", "consecutive_payment_failures", "status")
+        )
+
+    def run(self, run_date=None):
+        run_date = run_date or timezone.localdate()
+        run, _ = BillingRun.objects.get_or_create(run_date=run_date)
+        if run.status == BillingRun.Status.COMPLETED:
+            logger.info("Billing run for %s already completed", run_date)
+            return run
+        if not self._claim(run):
+            logger.warning("Billing run for %s is already in progress elsewhere", run_date)
+            run.refresh_from_db()
+            return run
+
+        # Fixed for the whole run, so resuming later doesn't widen the selection.
+        cutoff = timezone.make_aware(datetime.combine(run_date, time.min)) + self.lookahead
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="billing") as pool:
+                self.reconcile(pool)
+                while True:
+                    chunk = list(self.due(run.checkpoint, cutoff)[:self.chunk_size])
+                    if not chunk:
+                        break
+                    attempts = self._start_attempts(run, chunk)
+                    results = list(pool.map(self._charge, [attempt.subscription for attempt in attempts]))
+                    self._record(run, chunk[-1], attempts, results)
+        finally:
+            BillingRun.objects.filter(pk=run.pk).update(lease_expires_at=None)
+
+        BillingRun.objects.filter(pk=run.pk).update(status=BillingRun.Status.COMPLETED, finished_at=timezone.now())
+        run.refresh_from_db()
+        return run
+
+    def _claim(self, run):
+        # A guarded UPDATE, so two overlapping cron runs can't both take the lease.
+        # An expired lease (the holder died) may be taken over.
+        now = timezone.now()
+        return BillingRun.objects.filter(
+            Q(lease_expires_at__isnull=True) | Q(lease_expires_at__lt=now),
+            pk=run.pk, status=BillingRun.Status.RUNNING,
+        ).update(lease_expires_at=now + self.lease) == 1
+
+    def reconcile(self, pool=None):
+        """
+        Ask the gateway about every charge still awaiting confirmation and settle
+        those it has since approved or declined (covers missed payment notifications).
+        """
+        pending = list(
+            BillingAttempt.objects.filter(success=None).exclude(reference="").only("run", "subscription", "reference")
+        )
+        lookups = (pool.map if pool else map)(self.client.lookup, [attempt.reference for attempt in pending])
+        settled = sum(self.settle(attempt, result) for attempt, result in zip(pending, lookups))
+        if pending:
+            logger.info("Billing: settled %s of %s charges awaiting confirmation", settled, len(pending))
+
+    def settle(self, attempt, result):
+        """
+        Apply the gateway's final answer for a charge that was awaiting confirmation.
+        Returns whether it settled the attempt (it is settled at most once).
+        """
+        if result.success is None:
+            return False
+        now = timezone.now()
+        with transaction.atomic():
+            if not BillingAttempt.objects.filter(pk=attempt.pk, success=None).update(
+                success=result.success, error=result.error
+            ):
+                return False
+            if result.success:
+                # Cover may have lapsed while the subscriber was deciding.
+                self._renew(attempt.subscription_id, now, reactivate=True)
+                counts = {"charged": F("charged") + 1}
+            else:
+                counts = {"failed": F("failed") + 1, "paused": F("paused") + self._fail(attempt.subscription_id, now)}
+            BillingRun.objects.filter(pk=attempt.run_id).update(pending=F("pending") - 1, **counts)
+        return True
+
+    def _start_attempts(self, run, chunk):
+        """
+        Commit a pending attempt for every subscription in the chunk that has none
+        in this run yet, and return those attempts: only their subscriptions may be charged.
+        Subscriptions with a charge still awaiting confirmation from an earlier run
+        are skipped too.
+        """
+        ids = [s.id for s in chunk]
+        attempted = BillingAttempt.objects.filter(run=run, subscription_id__in=ids).values_list("subscription_id", flat=True)
+        seen = set(attempted)
+        if seen:
+            logger.warning(
+                "Billing %s: skipping %s subscriptions already attempted in this run (pending attempts need reconciling)",
+                run.run_date, len(seen),
+            )
+        seen.update(
+            BillingAttempt.objects.filter(subscription_id__in=ids, success=None).exclude(reference="")
+            .values_list("subscription_id", flat=True)
+        )
+        return BillingAttempt.objects.bulk_create(
+            [BillingAttempt(run=run, subscription=s, amount=self.amount) for s in chunk if s.id not in seen],
+            batch_size=self.chunk_size,
+        )
+
+    def _charge(self, subscription):
+        if not subscription.phone_number:
+            return ChargeResult(False, error="No phone number on file")
+        try:
+            return self.client.charge(
+                subscription.phone_number,
+                self.amount,
+                self.currency,
+                {"subscription_id": str(subscription.id)},
+            )
+        except Exception as e:
+            logger.exception("Charging subscription %s failed", subscription.id)
+            return ChargeResult(False, error=str(e)[:255])
+
+    def _record(self, run, checkpoint, attempts, results):
+        now = timezone.now()
+        charged = failed = paused = pending = 0
+        with transaction.atomic():
+            for attempt, result in zip(attempts, results):
+                if result.success is None:
+                    # Nothing is paid yet; see settle().
+                    pending += 1
+                elif result.success:
+                    self._renew(attempt.subscription_id, now)
+                    charged += 1
+                else:
+                    failed += 1
+                    paused += self._fail(attempt.subscription_id, now)
+                attempt.success, attempt.reference, attempt.error = result.success, result.reference, result.error
+            BillingAttempt.objects.bulk_update(attempts, ["success", "reference", "error"], batch_size=self.chunk_size)
+            BillingRun.objects.filter(pk=run.pk).update(
+                last_valid_until=checkpoint.valid_until,
+                last_subscription_id=checkpoint.id,
+                charged=F("charged") + charged,
+                failed=F("failed") + failed,
+                paused=F("paused") + paused,
+                pending=F("pending") + pending,
+                lease_expires_at=timezone.now() + self.lease,
+            )
+        run.last_valid_until, run.last_subscription_id = checkpoint.valid_until, checkpoint.id
+        logger.info("Billing %s: recorded up to subscription %s", run.run_date, run.last_subscription_id)
+
+    # The outcome is applied with guarded UPDATEs on the billing fields alone, computed from
+    # the row's current values: a subscription changed while its chunk was being charged
+    # (re-subscribed over USSD, expired) keeps that change.
+
+    def _renew(self, subscription_id, now, reactivate=False):
+        statuses = [Subscription.Status.ACTIVE, Subscription.Status.INACTIVE] if reactivate else [Subscription.Status.ACTIVE]
+        Subscription.objects.filter(pk=subscription_id, status__in=statuses).update(
+            status=Subscription.Status.ACTIVE, valid_until=_extended(now, COVER_PERIOD), consecutive_payment_failures=0,
+        )
+
+    def _fail(self, subscription_id, now):
+        """Count a failed charge; returns whether it paused the subscription."""
+        active = Subscription.objects.filter(pk=subscription_id, status=Subscription.Status.ACTIVE)
+        if active.filter(consecutive_payment_failures__gte=self.max_failures - 1).update(
+            consecutive_payment_failures=F("consecutive_payment_failures") + 1, status=Subscription.Status.PAUSED,
+        ):
+            return True
+        active.update(
+            consecutive_payment_failures=F("consecutive_payment_failures") + 1, valid_until=_extended(now, GRACE_STEP),
+        )
+        return False
+
+
+def _extended(now, period):
+    """valid_until moved `period` past the later of its current value and `now`."""
+    now = Value(now, output_field=DateTimeField())
+    return Greatest(Coalesce("valid_until", now), now) + period
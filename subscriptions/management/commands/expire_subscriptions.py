@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from subscriptions.models import Subscription
+
+
+class Command(BaseCommand):
+    help = "Mark every ACTIVE subscription whose valid_until has passed as INACTIVE (run from cron)."
+
+    def handle(self, *args, **options):
+        expired = Subscription.objects.expire_lapsed()
+        self.stdout.write(f"Expired {expired} subscription(s).")
@@ -0,0 +1,27 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from subscriptions.billing import BillingEngine
+
+
+class Command(BaseCommand):
+    help = "Charge every AfyaPlus subscription due for weekly renewal. Safe to re-run: resumes where it stopped."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--date", type=date.fromisoformat, help="Run date (YYYY-MM-DD), defaults to today.")
+        parser.add_argument("--workers", type=int, help="Concurrent payment requests.")
+        parser.add_argument("--chunk-size", type=int, help="Subscriptions selected and recorded per chunk.")
+
+    def handle(self, *args, **options):
+        overrides = {}
+        if options["workers"]:
+            overrides["WORKERS"] = options["workers"]
+        if options["chunk_size"]:
+            overrides["CHUNK_SIZE"] = options["chunk_size"]
+
+        run = BillingEngine.from_settings(**overrides).run(options["date"])
+        self.stdout.write(
+            f"Billing run {run.run_date}: {run.charged} charged, {run.failed} failed, {run.paused} paused, "
+            f"{run.pending} awaiting confirmation ({run.status})."
+        )
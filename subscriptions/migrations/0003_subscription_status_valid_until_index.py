@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-18 19:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0002_subscription_status'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['status', 'valid_until'], name='subscription_status_valid_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-18 19:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0004_billing'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(condition=models.Q(('status', 'ACTIVE')), fields=['valid_until'], name='subscription_active_valid_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 20:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0005_subscription_active_valid_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='billingrun',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='billingattempt',
+            name='success',
+            field=models.BooleanField(null=True),
+        ),
+    ]
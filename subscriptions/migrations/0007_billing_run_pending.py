@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 20:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0006_billing_pending_attempts_and_lease'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='billingrun',
+            name='pending',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 20:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0007_billing_run_pending'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='billingrun',
+            name='last_valid_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-18 20:52
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0008_billing_run_keyset_checkpoint'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='subscription',
+            name='subscription_active_valid_idx',
+        ),
+    ]
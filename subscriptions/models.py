@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
 
 
 class CustomUser(AbstractUser):
@@ -13,17 +14,107 @@ class CustomUser(AbstractUser):
         return self.username
 
 
+class SubscriptionQuerySet(models.QuerySet):
+    def lapsed(self, now=None):
+        """ACTIVE subscriptions whose cover has run out (served by the status/valid_until index)."""
+        return self.filter(status=Subscription.Status.ACTIVE, valid_until__lt=now or timezone.now())
+
+    def expire_lapsed(self, now=None):
+        """Flip every lapsed subscription to INACTIVE in one UPDATE; returns the number of rows."""
+        return self.lapsed(now).update(status=Subscription.Status.INACTIVE)
+
+
 class Subscription(models.Model):
     """
-    Stores FCM tokens for push notifications
+    AfyaPlus subscription state for a user, plus their FCM token for push notifications
     """
+    class Status(models.TextChoices):
+        ACTIVE = "ACTIVE", "Active"
+        INACTIVE = "INACTIVE", "Inactive"
+        PAUSED = "PAUSED", "Paused"
+
     user = models.ForeignKey(
         CustomUser,
         on_delete=models.CASCADE,
         related_name="subscriptions"
     )
-    fcm_token = models.CharField(max_length=255, unique=True)
+    # USSD subscribers may never install the app, so the token is optional
+    fcm_token = models.CharField(max_length=255, unique=True, null=True, blank=True)
+    phone_number = models.CharField(max_length=20, blank=True)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.INACTIVE)
+    start_date = models.DateTimeField(null=True, blank=True)
+    valid_until = models.DateTimeField(null=True, blank=True)
+    consecutive_payment_failures = models.PositiveIntegerField(default=0)
+    africastalking_subscription_id = models.CharField(max_length=100, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = SubscriptionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Expiry and billing: status=ACTIVE, range and order on valid_until.
+            models.Index(fields=["status", "valid_until"], name="subscription_status_valid_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.status}"
+
+
+class BillingRun(models.Model):
+    """
+    One nightly renewal run. Progress is checkpointed per chunk so an
+    interrupted run resumes after the last fully recorded subscription,
+    by its (valid_until, id) position.
+    """
+    class Status(models.TextChoices):
+        RUNNING = "RUNNING", "Running"
+        COMPLETED = "COMPLETED", "Completed"
+
+    run_date = models.DateField(unique=True)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.RUNNING)
+    last_valid_until = models.DateTimeField(null=True, blank=True)
+    last_subscription_id = models.BigIntegerField(default=0)
+    # Set while a process is working on the run; see BillingEngine._claim.
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    charged = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    paused = models.PositiveIntegerField(default=0)
+    # Charges accepted by the gateway and still awaiting the subscriber's confirmation
+    pending = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def checkpoint(self):
+        """(valid_until, id) of the last recorded subscription, None before the first chunk."""
+        if self.last_valid_until is None:
+            return None
+        return self.last_valid_until, self.last_subscription_id
+
+    def __str__(self):
+        return f"Billing run {self.run_date} ({self.status})"
+
+
+class BillingAttempt(models.Model):
+    """
+    Outcome of charging one subscription in one run. Written as pending
+    (success=None) before the charge is sent, so a run never charges twice.
+    A pending attempt with a reference was accepted by the gateway and awaits
+    the subscriber's confirmation; one without was interrupted mid-charge.
+    """
+    run = models.ForeignKey(BillingRun, on_delete=models.CASCADE, related_name="attempts")
+    subscription = models.ForeignKey(Subscription, on_delete=models.CASCADE, related_name="billing_attempts")
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    success = models.BooleanField(null=True)
+    reference = models.CharField(max_length=100, blank=True)
+    error = models.CharField(max_length=255, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["run", "subscription"], name="billing_attempt_once_per_run"),
+        ]
+
     def __str__(self):
-        return f"{self.user.username} - {self.fcm_token[:10]}"
+        outcome = "pending" if self.success is None else "ok" if self.success else "failed"
+        return f"{self.subscription_id} @ {self.run.run_date}: {outcome}"
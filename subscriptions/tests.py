@@ -0,0 +1,324 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipIf
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import ussd, views
+from .billing import BillingEngine, ChargeResult, FakePaymentClient
+from .models import BillingAttempt, BillingRun, CustomUser, Subscription
+
+
+class UssdMenuTests(TestCase):
+    def setUp(self):
+        ussd.sessions.clear()
+        self.client = APIClient()
+
+    def hop(self, text, session_id="s-1", phone="+255700000001"):
+        response = self.client.post(
+            "/api/subscriptions/ussd-menu/",
+            {"sessionId": session_id, "phoneNumber": phone, "text": text},
+        )
+        return response.data
+
+    def test_subscribe_flow(self):
+        self.assertTrue(self.hop("").startswith("CON Welcome to AfyaPlus"))
+        self.assertEqual(self.hop("1"), "END Subscription successful. Cover active for 7 days.")
+
+        subscription = Subscription.objects.get(user__username="user_+255700000001")
+        self.assertEqual(subscription.status, Subscription.Status.ACTIVE)
+        self.assertEqual(subscription.phone_number, "+255700000001")
+
+    def test_later_hops_are_answered_from_the_session(self):
+        self.hop("")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.hop("2"), "END INACTIVE.")
+
+    def test_invalid_option_ends_session(self):
+        self.hop("")
+        self.assertEqual(self.hop("9"), "END Invalid option.")
+        self.assertIsNone(ussd.sessions.get("s-1"))
+
+    def test_unknown_session_replays_full_history(self):
+        self.assertEqual(self.hop("1", session_id="fresh"), "END Subscription successful. Cover active for 7 days.")
+
+    def test_session_is_bound_to_its_phone_number(self):
+        self.hop("")
+        self.assertEqual(self.hop("1", phone="+255700000002"), "END Subscription successful. Cover active for 7 days.")
+
+        self.assertEqual(
+            Subscription.objects.get(user__username="user_+255700000002").status, Subscription.Status.ACTIVE
+        )
+        self.assertEqual(
+            Subscription.objects.get(user__username="user_+255700000001").status, Subscription.Status.INACTIVE
+        )
+
+    def test_subscribing_keeps_fields_written_during_the_session(self):
+        self.hop("")
+        Subscription.objects.filter(user__username="user_+255700000001").update(fcm_token="fresh-token")
+        self.hop("1")
+
+        self.assertEqual(Subscription.objects.get(user__username="user_+255700000001").fcm_token, "fresh-token")
+
+    def test_missing_phone_number(self):
+        self.assertEqual(self.hop("", phone=""), "END An error occurred.")
+
+
+class MenuCompileTests(TestCase):
+    def test_rejects_dangling_transitions(self):
+        with self.assertRaises(ValueError):
+            ussd.Menu({"root": {"prompt": "CON", "options": {"1": "missing"}}})
+
+    def test_nested_menus_are_walked_incrementally(self):
+        menu = ussd.Menu({
+            "root": {"prompt": "CON root", "options": {"1": "more"}},
+            "more": {"prompt": "CON more", "options": {"1": "done"}},
+            "done": {"action": lambda session: "END done"},
+        })
+        session = ussd.UssdSession(CustomUser(), Subscription(), menu.start)
+
+        self.assertEqual(menu.advance(session, ["1"]), "CON more")
+        self.assertEqual(menu.advance(session, ["1", "1"]), "END done")
+        self.assertEqual(session.consumed, 2)
+
+
+class ExpireSubscriptionsTests(TestCase):
+    def test_expires_only_lapsed_active_subscriptions(self):
+        now = timezone.now()
+        lapsed = Subscription.objects.create(
+            user=CustomUser.objects.create(username="a"), status="ACTIVE", valid_until=now - timedelta(hours=1))
+        current = Subscription.objects.create(
+            user=CustomUser.objects.create(username="b"), status="ACTIVE", valid_until=now + timedelta(days=1))
+        paused = Subscription.objects.create(
+            user=CustomUser.objects.create(username="c"), status="PAUSED", valid_until=now - timedelta(days=1))
+
+        out = StringIO()
+        with self.assertNumQueries(1):
+            call_command("expire_subscriptions", stdout=out)
+
+        self.assertIn("Expired 1", out.getvalue())
+        statuses = dict(Subscription.objects.values_list("id", "status"))
+        self.assertEqual(statuses, {lapsed.id: "INACTIVE", current.id: "ACTIVE", paused.id: "PAUSED"})
+
+    @skipIf(connection.vendor != "sqlite", "Plans are asserted in SQLite's EXPLAIN QUERY PLAN format")
+    def test_lapsed_subscriptions_are_found_by_the_status_index(self):
+        plan = Subscription.objects.lapsed().explain()
+        self.assertIn("USING INDEX subscription_status_valid_idx", plan)
+
+
+class SubscriptionStatusTests(TestCase):
+    def setUp(self):
+        views.status_cache.clear()
+        self.user = CustomUser.objects.create(username="patient")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_status_is_a_pure_read(self):
+        response = self.client.get("/api/subscriptions/status/")
+
+        self.assertEqual(response.data["status"], "INACTIVE")
+        self.assertFalse(Subscription.objects.exists())
+        self.assertIn("no-cache", response["Cache-Control"])
+        self.assertNotIn("max-age", response["Cache-Control"])
+
+    def test_lapsed_subscription_reads_inactive_without_writing(self):
+        subscription = Subscription.objects.create(
+            user=self.user, status="ACTIVE", valid_until=timezone.now() - timedelta(minutes=1))
+
+        self.assertEqual(self.client.get("/api/subscriptions/status/").data["status"], "INACTIVE")
+        subscription.refresh_from_db()
+        self.assertEqual(subscription.status, "ACTIVE")
+
+    def test_cached_until_subscription_changes(self):
+        subscription = Subscription.objects.create(user=self.user)
+        self.client.get("/api/subscriptions/status/")
+        with self.assertNumQueries(0):
+            self.client.get("/api/subscriptions/status/")
+
+        subscription.status = "ACTIVE"
+        subscription.valid_until = timezone.now() + timedelta(days=7)
+        subscription.save()
+        self.assertEqual(self.client.get("/api/subscriptions/status/").data["status"], "ACTIVE")
+
+
+class BillingEngineTests(TestCase):
+    def setUp(self):
+        self.today = timezone.localdate()
+        self.due_at = timezone.now() + timedelta(hours=1)
+
+    def subscribe(self, phone, **fields):
+        fields = {"status": "ACTIVE", "valid_until": self.due_at, **fields}
+        return Subscription.objects.create(
+            user=CustomUser.objects.create(username=phone), phone_number=phone, **fields)
+
+    def bill(self, client, **kwargs):
+        return BillingEngine(client, workers=4, chunk_size=2, **kwargs).run(self.today)
+
+    def test_charges_due_subscriptions_in_chunks(self):
+        paid = [self.subscribe(f"+2557000000{i:02}") for i in range(5)]
+        later = self.subscribe("+255700000099", valid_until=timezone.now() + timedelta(days=5))
+
+        client = FakePaymentClient()
+        run = self.bill(client)
+
+        self.assertEqual(run.status, BillingRun.Status.COMPLETED)
+        self.assertEqual((run.charged, run.failed, run.paused), (5, 0, 0))
+        self.assertEqual(sorted(client.charges), sorted(s.phone_number for s in paid))
+        for subscription in paid:
+            subscription.refresh_from_db()
+            self.assertEqual(subscription.valid_until, self.due_at + timedelta(days=7))
+        later.refresh_from_db()
+        self.assertFalse(later.billing_attempts.exists())
+
+    def test_failure_adds_grace_day_then_pauses(self):
+        struggling = self.subscribe("+255700000001", consecutive_payment_failures=1)
+        exhausted = self.subscribe("+255700000002", consecutive_payment_failures=2)
+
+        run = self.bill(FakePaymentClient(failing_numbers={"+255700000001", "+255700000002"}))
+
+        self.assertEqual((run.charged, run.failed, run.paused), (0, 2, 1))
+        struggling.refresh_from_db()
+        self.assertEqual(struggling.consecutive_payment_failures, 2)
+        self.assertEqual(struggling.valid_until, self.due_at + timedelta(days=1))
+        exhausted.refresh_from_db()
+        self.assertEqual(exhausted.status, Subscription.Status.PAUSED)
+        self.assertEqual(BillingAttempt.objects.filter(success=False).count(), 2)
+
+    def test_success_resets_failure_counter(self):
+        subscription = self.subscribe("+255700000001", consecutive_payment_failures=2)
+        self.bill(FakePaymentClient())
+        subscription.refresh_from_db()
+        self.assertEqual(subscription.consecutive_payment_failures, 0)
+
+    def test_changes_made_while_charging_are_kept(self):
+        renewed = self.subscribe("+255700000001")
+        paused = self.subscribe("+255700000002")
+        resubscribed_until = timezone.now() + timedelta(days=7)
+
+        start_attempts = BillingEngine._start_attempts
+
+        def concurrent_writes(engine, run, chunk):
+            # Another process writes after the chunk was read, while it is out at the gateway.
+            Subscription.objects.filter(pk=renewed.pk).update(valid_until=resubscribed_until)
+            Subscription.objects.filter(pk=paused.pk).update(status=Subscription.Status.PAUSED)
+            return start_attempts(engine, run, chunk)
+
+        with mock.patch.object(BillingEngine, "_start_attempts", concurrent_writes):
+            self.bill(FakePaymentClient())
+
+        renewed.refresh_from_db()
+        self.assertEqual(renewed.valid_until, resubscribed_until + timedelta(days=7))
+        paused.refresh_from_db()
+        self.assertEqual((paused.status, paused.valid_until), (Subscription.Status.PAUSED, self.due_at))
+
+    def test_pending_charge_leaves_cover_unchanged(self):
+        subscription = self.subscribe("+255700000001")
+
+        run = self.bill(FakePaymentClient(pending_numbers={"+255700000001"}))
+
+        self.assertEqual((run.charged, run.failed, run.pending), (0, 0, 1))
+        subscription.refresh_from_db()
+        self.assertEqual(subscription.valid_until, self.due_at)
+        attempt = subscription.billing_attempts.get()
+        self.assertEqual((attempt.success, attempt.reference), (None, f"fake-{subscription.id}"))
+
+    def test_next_run_settles_confirmed_charges_and_never_recharges_pending_ones(self):
+        confirmed = self.subscribe("+255700000001")
+        undecided = self.subscribe("+255700000002")
+        client = FakePaymentClient(pending_numbers={"+255700000001", "+255700000002"})
+        first = self.bill(client)
+
+        # Cover lapsed and was expired while the subscriber was deciding.
+        Subscription.objects.filter(pk=confirmed.pk).update(status=Subscription.Status.INACTIVE)
+        client.outcomes[f"fake-{confirmed.id}"] = ChargeResult(True, reference=f"fake-{confirmed.id}")
+        client.charges.clear()
+        self.today += timedelta(days=1)
+        self.bill(client)
+
+        self.assertEqual(client.charges, [])
+        confirmed.refresh_from_db()
+        self.assertEqual(confirmed.status, Subscription.Status.ACTIVE)
+        self.assertGreater(confirmed.valid_until, timezone.now() + timedelta(days=6))
+        undecided.refresh_from_db()
+        self.assertEqual(undecided.valid_until, self.due_at)
+        first.refresh_from_db()
+        self.assertEqual((first.charged, first.pending), (1, 1))
+
+    def test_payment_notification_settles_from_the_gateway(self):
+        subscription = self.subscribe("+255700000001")
+        reference = f"fake-{subscription.id}"
+        self.bill(FakePaymentClient(pending_numbers={"+255700000001"}))
+        declined = FakePaymentClient(outcomes={reference: ChargeResult(False, reference=reference, error="Declined")})
+
+        with mock.patch.object(BillingEngine, "from_settings", return_value=BillingEngine(declined)):
+            response = APIClient().post(
+                "/api/subscriptions/payments/notify/", {"transactionId": reference, "status": "Success"}, format="json"
+            )
+
+        self.assertEqual(response.status_code, 200)
+        attempt = subscription.billing_attempts.get()
+        self.assertEqual((attempt.success, attempt.error), (False, "Declined"))
+        subscription.refresh_from_db()
+        self.assertEqual(
+            (subscription.consecutive_payment_failures, subscription.valid_until), (1, self.due_at + timedelta(days=1))
+        )
+
+    def test_resumes_after_checkpoint_and_never_recharges(self):
+        first, second, third = (self.subscribe(f"+25570000000{i}") for i in range(3))
+        BillingRun.objects.create(
+            run_date=self.today, last_valid_until=first.valid_until, last_subscription_id=first.id, charged=1)
+
+        client = FakePaymentClient()
+        run = self.bill(client)
+        self.assertEqual(client.charges, [second.phone_number, third.phone_number])
+        self.assertEqual(run.charged, 3)
+
+        again = FakePaymentClient()
+        self.bill(again)
+        self.assertEqual(again.charges, [])
+
+    def test_run_interrupted_mid_chunk_never_recharges(self):
+        subscriptions = [self.subscribe(f"+25570000000{i}") for i in range(5)]
+
+        class Interrupted(FakePaymentClient):
+            def charge(self, phone_number, *args):
+                if len(self.charges) == 3:
+                    raise KeyboardInterrupt
+                return super().charge(phone_number, *args)
+
+        interrupted = Interrupted()
+        with self.assertRaises(KeyboardInterrupt):
+            BillingEngine(interrupted, workers=1, chunk_size=5).run(self.today)
+        self.assertEqual(len(interrupted.charges), 3)
+
+        again = FakePaymentClient()
+        with self.assertLogs("subscriptions.billing", "WARNING"):
+            run = self.bill(again)
+        self.assertEqual(again.charges, [])
+        self.assertEqual(run.status, BillingRun.Status.COMPLETED)
+        self.assertEqual(BillingAttempt.objects.filter(success=None).count(), len(subscriptions))
+
+    def test_overlapping_runs_are_refused_until_the_lease_expires(self):
+        self.subscribe("+255700000001")
+        BillingRun.objects.create(run_date=self.today, lease_expires_at=timezone.now() + timedelta(minutes=5))
+
+        client = FakePaymentClient()
+        with self.assertLogs("subscriptions.billing", "WARNING"):
+            run = self.bill(client)
+        self.assertEqual((client.charges, run.status), ([], BillingRun.Status.RUNNING))
+
+        BillingRun.objects.update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        run = self.bill(client)
+        self.assertEqual((client.charges, run.status), (["+255700000001"], BillingRun.Status.COMPLETED))
+        self.assertIsNone(run.lease_expires_at)
+
+    def test_command(self):
+        self.subscribe("+255700000001")
+        out = StringIO()
+        with self.settings(BILLING={"PAYMENT_CLIENT": "subscriptions.billing.FakePaymentClient"}):
+            call_command("run_billing", "--workers", "2", stdout=out)
+        self.assertIn("1 charged, 0 failed, 0 paused", out.getvalue())
@@ -2,7 +2,7 @@
 
 from django.urls import path
 # --- EDIT THIS LINE ---
-from .views import UssdMenuHandlerView, SubscriptionStatusView, SaveFcmTokenView 
+from .views import UssdMenuHandlerView, SubscriptionStatusView, SaveFcmTokenView, PaymentNotificationView
 
 urlpatterns = [
     # This path remains unchanged
@@ -10,5 +10,8 @@ urlpatterns = [
      
     # This path also remains unchanged. It handles /api/subscriptions/status/
     path('status/', SubscriptionStatusView.as_view(), name='subscription-status'),
+
+    # Africa's Talking payment notifications: /api/subscriptions/payments/notify/
+    path('payments/notify/', PaymentNotificationView.as_view(), name='payment-notification'),
     
 ]
\ No newline at end of file
@@ -0,0 +1,151 @@
+# subscriptions/ussd.py
+"""
+USSD menu as a precompiled state machine, with per-session state kept in memory.
+
+Africa's Talking sends the whole input history on every hop ("1*2*3"). Instead
+of re-parsing that and re-loading the user and subscription each time, we keep
+a UssdSession per sessionId (TTL + LRU) holding the resolved user, their
+subscription, the current menu state and how many inputs were already applied.
+Each hop then only applies the new inputs through a flat transition table.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+from api.cache import TTLCache
+
+from .models import Subscription
+
+User = get_user_model()
+
+
+# ==================================================
+# MENU ACTIONS (terminal states)
+# ==================================================
+def subscribe(session):
+    subscription = session.subscription
+    subscription.status = Subscription.Status.ACTIVE
+    subscription.start_date = timezone.now()
+    subscription.valid_until = timezone.now() + timedelta(days=7)
+    # The session's copy can be minutes old: only write what subscribing changes.
+    subscription.save(update_fields=["status", "start_date", "valid_until"])
+
+    return "END Subscription successful. Cover active for 7 days."
+
+
+def check_status(session):
+    subscription = session.subscription
+    if (
+        subscription.status == Subscription.Status.ACTIVE
+        and subscription.valid_until
+        and subscription.valid_until > timezone.now()
+    ):
+        return f"END ACTIVE until {subscription.valid_until:%d-%b-%Y}"
+    return "END INACTIVE."
+
+
+# Each state either shows a prompt with numbered options, or runs an action and ends.
+MENU = {
+    "root": {
+        "prompt": (
+            "CON Welcome to AfyaPlus\n"
+            "1. Subscribe (1 Week)\n"
+            "2. Check My Status"
+        ),
+        "options": {"1": "subscribe", "2": "status"},
+    },
+    "subscribe": {"action": subscribe},
+    "status": {"action": check_status},
+}
+
+INVALID_OPTION = "END Invalid option."
+
+
+class Menu:
+    """A menu definition compiled into flat (state, input) -> state lookups."""
+
+    def __init__(self, definition, start="root"):
+        self.start = start
+        self.prompts = {}
+        self.actions = {}
+        self.transitions = {}
+        for name, state in definition.items():
+            if "action" in state:
+                self.actions[name] = state["action"]
+            else:
+                self.prompts[name] = state["prompt"]
+            for choice, target in state.get("options", {}).items():
+                if target not in definition:
+                    raise ValueError(f"USSD menu state {name!r} points at unknown state {target!r}")
+                self.transitions[(name, choice)] = target
+
+    def advance(self, session, inputs):
+        """Apply inputs the session has not seen yet and return the response text."""
+        if len(inputs) < session.consumed:
+            # The history went backwards (gateway retry/restart): replay from the top.
+            session.state, session.consumed = self.start, 0
+
+        for choice in inputs[session.consumed:]:
+            session.consumed += 1
+            target = self.transitions.get((session.state, choice))
+            if target is None:
+                session.finished = True
+                return INVALID_OPTION
+            session.state = target
+            action = self.actions.get(target)
+            if action is not None:
+                session.finished = True
+                return action(session)
+
+        return self.prompts[session.state]
+
+
+menu = Menu(MENU)
+
+
+class UssdSession:
+    def __init__(self, user, subscription, state, phone_number=None):
+        self.user = user
+        self.subscription = subscription
+        self.state = state
+        self.phone_number = phone_number
+        self.consumed = 0
+        self.finished = False
+
+
+sessions = TTLCache(
+    maxsize=getattr(settings, "USSD_SESSION_CACHE_SIZE", 10000),
+    ttl=getattr(settings, "USSD_SESSION_TTL", 180),
+)
+
+
+def start_session(phone_number):
+    user, _ = User.objects.get_or_create(
+        username=f"user_{phone_number}"
+    )
+
+    subscription, _ = Subscription.objects.get_or_create(
+        user=user,
+        defaults={"phone_number": phone_number}
+    )
+    return UssdSession(user, subscription, menu.start, phone_number)
+
+
+def handle(session_id, phone_number, text):
+    """Answer one USSD hop. Only the first hop of a session touches the database for lookups."""
+    session = sessions.get(session_id) if session_id else None
+    # A session id is only trusted for the phone that opened it.
+    if session is None or session.finished or session.phone_number != phone_number:
+        session = start_session(phone_number)
+
+    inputs = text.split("*") if text else []
+    response = menu.advance(session, inputs)
+
+    if session_id:
+        if session.finished:
+            sessions.delete(session_id)
+        else:
+            sessions.set(session_id, session)
+    return response
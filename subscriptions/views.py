@@ -1,20 +1,25 @@
 # subscriptions/views.py
 
 import logging
-from datetime import timedelta
 
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.utils import timezone
-from django.contrib.auth import get_user_model
+from django.utils.cache import patch_cache_control
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import permissions
 
-from .models import Subscription
+from api.cache import TTLCache
+
+from . import ussd
+from .billing import BillingEngine
+from .models import BillingAttempt, Subscription
 from .serializers import SubscriptionSerializer
 
 logger = logging.getLogger(__name__)
-User = get_user_model()
 
 
 # ==================================================
@@ -33,42 +38,9 @@ class UssdMenuHandlerView(APIView):
         if not phone_number:
             return Response("END An error occurred.", content_type="text/plain")
 
-        user, _ = User.objects.get_or_create(
-            username=f"user_{phone_number}"
-        )
-
-        subscription, _ = Subscription.objects.get_or_create(
-            user=user,
-            defaults={"phone_number": phone_number}
-        )
-
-        if text == "":
-            response = (
-                "CON Welcome to AfyaPlus\n"
-                "1. Subscribe (1 Week)\n"
-                "2. Check My Status"
-            )
-
-        elif text == "1":
-            subscription.status = Subscription.Status.ACTIVE
-            subscription.start_date = timezone.now()
-            subscription.valid_until = timezone.now() + timedelta(days=7)
-            subscription.save()
-
-            response = "END Subscription successful. Cover active for 7 days."
-
-        elif text == "2":
-            if (
-                subscription.status == Subscription.Status.ACTIVE
-                and subscription.valid_until
-                and subscription.valid_until > timezone.now()
-            ):
-                response = f"END ACTIVE until {subscription.valid_until:%d-%b-%Y}"
-            else:
-                response = "END INACTIVE."
-
-        else:
-            response = "END Invalid option."
+        # Session state (user, subscription, menu position) is cached per sessionId,
+        # so only the first hop of a session hits the database for lookups.
+        response = ussd.handle(session_id, phone_number, text)
 
         return Response(response, content_type="text/plain")
 
@@ -80,19 +52,63 @@ class SubscriptionStatusView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        subscription, _ = Subscription.objects.get_or_create(user=request.user)
+        # Pure read: expiry is applied in bulk by `manage.py expire_subscriptions`,
+        # and the serialized status is cached per user for a few seconds.
+        data = status_cache.get(request.user.id)
+        if data is None:
+            data, expires_at = self._load(request.user)
+            status_cache.set(request.user.id, data, expires_at=expires_at)
+
+        response = Response(data)
+        # Only the server-side cache is invalidated on change, so clients must not keep their own copy.
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def _load(self, user):
+        now = timezone.now()
+        # Users who never subscribed get the default (INACTIVE) without creating a row.
+        subscription = Subscription.objects.filter(user=user).first() or Subscription(user=user)
+        data = dict(SubscriptionSerializer(subscription).data)
+
+        expires_at = now.timestamp() + status_cache.ttl
+        if subscription.status == Subscription.Status.ACTIVE and subscription.valid_until:
+            if subscription.valid_until < now:
+                # Lapsed but not swept yet: report what the sweeper will write.
+                data["status"] = Subscription.Status.INACTIVE
+            else:
+                # Never serve a cached ACTIVE past the end of the cover.
+                expires_at = min(expires_at, subscription.valid_until.timestamp())
+        return data, expires_at
+
+
+# Serialized status per user id; dropped whenever that user's subscription changes.
+status_cache = TTLCache(
+    maxsize=getattr(settings, "SUBSCRIPTION_STATUS_CACHE_SIZE", 10000),
+    ttl=getattr(settings, "SUBSCRIPTION_STATUS_CACHE_TTL", 30),
+)
+
 
-        # Auto-expire
-        if (
-            subscription.status == Subscription.Status.ACTIVE
-            and subscription.valid_until
-            and subscription.valid_until < timezone.now()
-        ):
-            subscription.status = Subscription.Status.INACTIVE
-            subscription.save()
-
-        serializer = SubscriptionSerializer(subscription)
-        return Response(serializer.data)
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def _invalidate_status_cache(sender, instance, **kwargs):
+    status_cache.delete(instance.user_id)
+
+
+# ==================================================
+# PAYMENT NOTIFICATION (Africa's Talking callback)
+# ==================================================
+class PaymentNotificationView(APIView):
+    permission_classes = [permissions.AllowAny]
+
+    def post(self, request):
+        # Notifications aren't signed: the outcome is read back from the gateway
+        # (and only for a charge we are actually waiting on), never from the body.
+        reference = request.data.get("transactionId")
+        attempt = reference and BillingAttempt.objects.filter(success=None, reference=reference).first()
+        if attempt:
+            engine = BillingEngine.from_settings()
+            engine.settle(attempt, engine.client.lookup(reference))
+        return Response({"status": "received"})
 
 
 # ==================================================